@@ -0,0 +1,53 @@
+from async_transport import AsyncPeerTransport
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.datastructures import MultiDict
+from endpoints import ROUTES, handle
+from urllib.parse import parse_qsl
+from aiohttp import web
+import asyncio
+import config
+
+# endpoints driven by clients and other nodes, limited to INBOUND_LIMIT requests in progress
+INBOUND = {'/register_transaction', '/register_transactions', '/create_new_transaction'}
+# ring and chain messages of long chains do not fit in the default limit of aiohttp
+MAX_BODY_SIZE = 1024 ** 3
+
+def create_app(node):
+    # serves the handlers of endpoints.py on the event loop, running each of them in a worker thread
+    # the node's requests to other nodes run on the same loop if it uses an AsyncPeerTransport
+    executor = ThreadPoolExecutor(max_workers=config.SERVER_WORKERS)
+    inbound = asyncio.Semaphore(config.INBOUND_LIMIT)
+
+    def view(path, handler):
+        async def serve(request):
+            data = await request.read()
+            values = MultiDict(list(request.query.items()))
+            if request.content_type == 'application/x-www-form-urlencoded':
+                for (key, value) in parse_qsl(data.decode()):
+                    values.add(key, value)
+            loop = asyncio.get_running_loop()
+            if path in INBOUND:
+                # reject instead of queueing when the node is saturated, the peer transports retry 503 (also for POST) after Retry-After
+                if inbound.locked():
+                    return web.json_response({'message': "The node is overloaded, try again later."},
+                                             status=503, headers={'Retry-After': '1'})
+                async with inbound:
+                    (payload, status) = await loop.run_in_executor(executor, handle, handler, node, data, values)
+            else:
+                (payload, status) = await loop.run_in_executor(executor, handle, handler, node, data, values)
+            if isinstance(payload, bytes):
+                return web.Response(body=payload, status=status)
+            return web.json_response(payload, status=status)
+        return serve
+
+    app = web.Application(client_max_size=MAX_BODY_SIZE)
+    if isinstance(node.transport, AsyncPeerTransport):
+        app.on_startup.append(node.transport.start)
+        app.on_cleanup.append(node.transport.close)
+    for (path, method, handler) in ROUTES:
+        app.router.add_route(method, path, view(path, handler))
+    return app
+
+def run(node, host, port):
+    # listens in the given address until the process is stopped
+    web.run_app(create_app(node), host=host, port=int(port), print=None)
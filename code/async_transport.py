@@ -0,0 +1,114 @@
+from transport import PeerStats, POOL_SIZE, TIMEOUT, RETRY_STATUSES, RETRIES, BACKOFF_FACTOR, CONNECT_RETRIES, READ_RETRIES, BACKOFF_MAX, QUEUE_SIZE
+from threading import Event, Lock
+import requests
+import aiohttp
+import asyncio
+import time
+
+class PeerResponse:
+    def __init__(self, status_code, content):
+        # the parts of a requests.Response that the node reads
+        self.status_code = status_code
+        self.content = content
+
+class AsyncPeerTransport:
+    def __init__(self):
+        # the peer transport of the asyncio server: requests to peers are multiplexed on its event loop over one aiohttp session,
+        # the node's threads only wait for their results, with the same retries, send queues and statistics as transport.PeerTransport
+        self.loop = None
+        self.session = None
+        self.ready = Event()
+        self.queues = {}
+        self.peer_stats = {}
+        self.lock = Lock()
+
+    async def start(self, app):
+        # binds the transport to the event loop of the server once it runs
+        self.loop = asyncio.get_running_loop()
+        timeout = aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=POOL_SIZE), timeout=timeout)
+        self.ready.set()
+
+    async def close(self, app):
+        await self.session.close()
+
+    def run(self, coroutine):
+        # runs a coroutine on the event loop and waits for its result (never called from the loop itself)
+        self.ready.wait()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def stats_of(self, address):
+        with self.lock:
+            if address not in self.peer_stats:
+                self.peer_stats[address] = PeerStats()
+            return self.peer_stats[address]
+
+    async def fetch(self, address, path, data=None, method='post'):
+        # sends a request and records its latency and retries, raises requests.ConnectionError like transport.Peer once the retries are used up
+        stats = self.stats_of(address)
+        start = time.time()
+        retries = 0
+        connect_errors = 0
+        read_errors = 0
+        while True:
+            delay = BACKOFF_FACTOR * 2 ** (retries - 1) if retries > 0 else 0
+            try:
+                async with self.session.request(method.upper(), address + path, data=data) as response:
+                    content = await response.read()
+                    if response.status not in RETRY_STATUSES or retries == RETRIES:
+                        stats.record(time.time() - start, retries, response.status >= 500)
+                        return PeerResponse(response.status, content)
+                    # an overloaded peer says when to try again
+                    retry_after = response.headers.get('Retry-After', '')
+                    delay = int(retry_after) if retry_after.isdigit() else delay
+            except aiohttp.ClientConnectorError as error:
+                connect_errors += 1
+                if connect_errors > CONNECT_RETRIES or retries == RETRIES:
+                    stats.record(time.time() - start, retries, True)
+                    raise requests.ConnectionError(error)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                read_errors += 1
+                if read_errors > READ_RETRIES or retries == RETRIES:
+                    stats.record(time.time() - start, retries, True)
+                    raise requests.ConnectionError(error)
+            retries += 1
+            await asyncio.sleep(min(delay, BACKOFF_MAX))
+
+    def request(self, address, path, data=None, method='post'):
+        return self.run(self.fetch(address, path, data, method))
+
+    def send(self, addresses, path, data):
+        # queues a request to every address without waiting, the requests to a peer are sent one by one in order
+        self.ready.wait()
+        self.loop.call_soon_threadsafe(self.enqueue, addresses, path, data)
+
+    def enqueue(self, addresses, path, data):
+        # the request is dropped for a peer that is so far behind that its queue is full
+        for address in addresses:
+            if address not in self.queues:
+                self.queues[address] = asyncio.Queue(QUEUE_SIZE)
+                self.loop.create_task(self.send_loop(address, self.queues[address]))
+            try:
+                self.queues[address].put_nowait((path, data))
+            except asyncio.QueueFull:
+                self.stats_of(address).drop()
+
+    async def send_loop(self, address, queue):
+        while True:
+            (path, data) = await queue.get()
+            try:
+                await self.fetch(address, path, data)
+            except requests.RequestException:
+                pass
+
+    def broadcast(self, addresses, path, data=None, method='post'):
+        # sends a request to every address concurrently and returns the responses of the peers that answered
+        async def gather():
+            return await asyncio.gather(*[self.fetch(address, path, data, method) for address in addresses], return_exceptions=True)
+        return [r for r in self.run(gather()) if not isinstance(r, BaseException)]
+
+    def stats(self):
+        # returns the statistics of every peer by address
+        with self.lock:
+            peers = list(self.peer_stats.items())
+        return {address: stats.summary() for (address, stats) in peers}
@@ -0,0 +1,274 @@
+from transaction import Transaction, TxInput, TxOutput, output_id
+from blockchain import Blockchain
+from verifier import Verifier
+from argparse import ArgumentParser
+from wallet import Wallet
+from block import Block
+from ring import Ring
+import config
+import keys
+import tracemalloc
+import pickle
+import random
+import uuid
+import time
+import wire
+import os
+
+def timed(function, repeat):
+    # returns the average seconds of a call
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+def sample_chain(nodes, blocks, capacity):
+    # builds a ring of wallets and a chain of signed transactions between them (without mining)
+    wallets = [Wallet() for _ in range(nodes)]
+    ring = Ring()
+    for i, wallet in enumerate(wallets):
+        ring.add(i, '127.0.0.1', str(5000 + i), wallet.public_key)
+    chain = []
+    previous_hash = '0' * 64
+    for index in range(blocks):
+        transactions = []
+        for _ in range(capacity):
+            sender, receiver = random.sample(wallets, 2)
+            inputs = [TxInput(random.getrandbits(128), random.randint(1, 100)) for _ in range(2)]
+            transactions.append(Transaction(sender.public_key, receiver.public_key, 1, inputs, sender.private_key))
+        block = Block(index, transactions, previous_hash)
+        previous_hash = block.current_hash
+        chain.append(block)
+    for block in chain:
+        for transaction in block.transactions:
+            for output in transaction.transaction_outputs:
+                ring.utxos.add(output)
+    return ring, chain
+
+def benchmark_wire(args):
+    # compares payload size and encode/decode time of the wire format and pickle
+    ring, chain = sample_chain(args.nodes, args.blocks, args.capacity)
+    transaction = chain[-1].transactions[0]
+    cases = [
+        ('transaction', transaction,
+         lambda: wire.encode_transaction(transaction), lambda data: wire.decode_transaction(data, ring)),
+        ('block', chain[-1],
+         lambda: wire.encode_block(chain[-1]), lambda data: wire.decode_block(data, ring)),
+        ('ring and chain', (ring, chain),
+         lambda: wire.encode_ring_and_chain(ring, chain), wire.decode_ring_and_chain)
+    ]
+    print(f'{"message":<16}{"format":<8}{"bytes":>10}{"encode us":>12}{"decode us":>12}')
+    for (name, obj, encode, decode) in cases:
+        pickled = pickle.dumps(obj)
+        encoded = encode()
+        results = [
+            ('pickle', len(pickled), timed(lambda: pickle.dumps(obj), args.repeat), timed(lambda: pickle.loads(pickled), args.repeat)),
+            ('wire', len(encoded), timed(encode, args.repeat), timed(lambda: decode(encoded), args.repeat))
+        ]
+        for (format, size, encode_time, decode_time) in results:
+            print(f'{name:<16}{format:<8}{size:>10}{encode_time * 1e6:>12.1f}{decode_time * 1e6:>12.1f}')
+
+def benchmark_header(args):
+    # compares the time to hash a header and to check a block once and again, for growing block capacities
+    print(f'{"capacity":>10}{"hash us":>12}{"first check us":>16}{"cached check us":>17}')
+    for capacity in args.capacities:
+        _, chain = sample_chain(2, 1, capacity)
+        block = chain[0]
+        def first_check():
+            block.checked_hash = None
+            block.verify_hash()
+        print(f'{capacity:>10}{timed(block.calc_hash, args.repeat) * 1e6:>12.1f}'
+              f'{timed(first_check, args.repeat) * 1e6:>16.1f}{timed(block.verify_hash, args.repeat) * 1e6:>17.2f}')
+
+def benchmark_validation(args):
+    # times full chain validation with one and many verifier workers, and again from a checkpoint
+    config.MINING_DIFFICULTY = 0
+    _, blocks = sample_chain(args.nodes, args.blocks, args.capacity)
+    chain = Blockchain()
+    chain.reset(blocks)
+    for workers in sorted(set([1, args.workers])):
+        verifier = Verifier(workers)
+        chain.checkpoints = {}
+        start = time.perf_counter()
+        valid = chain.validate_chain(verifier)
+        print(f'{workers} workers: {time.perf_counter() - start:.3f}s (valid: {valid})')
+        verifier.shutdown()
+    verifier = Verifier(args.workers)
+    start = time.perf_counter()
+    chain.validate_chain(verifier)
+    print(f'from checkpoint {chain.last_checkpoint()}: {time.perf_counter() - start:.6f}s')
+
+def benchmark_keys(args):
+    # compares key generation, signing and verification of the signature schemes, and the sizes of their keys and transactions
+    print(f'{"scheme":<10}{"keygen ms":>11}{"sign/s":>10}{"verify/s":>10}{"key bytes":>11}{"signature":>11}{"tx bytes":>10}')
+    for key_type in args.types:
+        keygen = timed(lambda: keys.generate_key(key_type), args.keygen_repeat)
+        wallets = [Wallet(key_type=key_type) for _ in range(2)]
+        ring = Ring()
+        for i, wallet in enumerate(wallets):
+            ring.add(i, '127.0.0.1', str(5000 + i), wallet.public_key)
+        transaction = Transaction(wallets[0].public_key, wallets[1].public_key, 1, [TxInput(1, 10)], wallets[0].private_key)
+        message = transaction.transaction_id.encode('ISO-8859-1')
+        signature = keys.sign(wallets[0].private_key, message)
+        sign = timed(lambda: keys.sign(wallets[0].private_key, message), args.repeat)
+        verify = timed(lambda: keys.verify(wallets[0].public_key, message, signature), args.repeat)
+        print(f'{key_type:<10}{keygen * 1e3:>11.2f}{1 / sign:>10.0f}{1 / verify:>10.0f}{len(wallets[0].public_key):>11}'
+              f'{len(signature):>11}{len(wire.encode_transaction(transaction)):>10}')
+
+class LegacyTransaction:
+    # a transaction before the slotted types, with dict inputs and outputs, random output ids and public keys as recipients
+    pass
+
+def legacy_transaction(transaction):
+    # the old layout of a transaction, sharing the strings of the given one like a decoded transaction did
+    legacy = LegacyTransaction()
+    legacy.sender_address = transaction.sender_address
+    legacy.receiver_address = transaction.receiver_address
+    legacy.amount = transaction.amount
+    legacy.transaction_inputs = [{'id': input.id, 'value': input.value} for input in transaction.transaction_inputs]
+    legacy.transaction_id = transaction.transaction_id
+    legacy.transaction_outputs = [{
+        'id': uuid.uuid4().int,
+        'transaction_id': transaction.transaction_id,
+        'recipient': address,
+        'value': output.value
+    } for (address, output) in zip((transaction.sender_address, transaction.receiver_address), transaction.transaction_outputs)]
+    legacy.signature = transaction.signature
+    return legacy
+
+def compact_transaction(transaction):
+    # a copy of a transaction in the current layout, sharing the same strings
+    compact = Transaction.__new__(Transaction)
+    compact.sender_address = transaction.sender_address
+    compact.receiver_address = transaction.receiver_address
+    compact.amount = transaction.amount
+    compact.transaction_inputs = [TxInput(input.id, input.value) for input in transaction.transaction_inputs]
+    compact.transaction_id = transaction.transaction_id
+    compact.transaction_outputs = [TxOutput(output_id(transaction.transaction_id, i), output.transaction_id, output.recipient, output.value)
+                                   for i, output in enumerate(transaction.transaction_outputs)]
+    compact.signature = transaction.signature
+    return compact
+
+def allocated(function):
+    # returns the result of a call and the bytes it allocated that are still in use
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    result = function()
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return result, size
+
+def benchmark_memory(args):
+    # compares the memory per transaction of the dict layout and the slotted layout, for a long chain held in memory
+    _, chain = sample_chain(args.nodes, args.blocks, args.capacity)
+    transactions = [t for block in chain for t in block.transactions]
+    print(f'{len(transactions)} transactions in {len(chain)} blocks')
+    print(f'{"layout":<10}{"bytes/tx":>10}{"chain MB":>10}{"pickled bytes/tx":>18}')
+    for (name, copy) in (('dict', legacy_transaction), ('slotted', compact_transaction)):
+        copies, size = allocated(lambda: [copy(t) for t in transactions])
+        pickled = len(pickle.dumps(copies))
+        print(f'{name:<10}{size / len(copies):>10.0f}{size / 2 ** 20:>10.2f}{pickled / len(copies):>18.0f}')
+    print('Keys, ids and signatures are shared with the decoded chain in both layouts, only the containers are counted.')
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Micro-benchmarks of the noobcash components.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    wire_parser = subparsers.add_parser('wire', help='Compare the wire format with pickle.')
+    wire_parser.add_argument('-n',
+                             '--nodes',
+                             type=int,
+                             help='The number of wallets in the ring.',
+                             default=5)
+    wire_parser.add_argument('-b',
+                             '--blocks',
+                             type=int,
+                             help='The number of blocks in the chain.',
+                             default=20)
+    wire_parser.add_argument('-c',
+                             '--capacity',
+                             type=int,
+                             help='The transaction capacity of a block.',
+                             default=10)
+    wire_parser.add_argument('-r',
+                             '--repeat',
+                             type=int,
+                             help='The number of times every operation is timed.',
+                             default=100)
+    wire_parser.set_defaults(run=benchmark_wire)
+
+    header_parser = subparsers.add_parser('header', help='Time block hashing for growing block capacities.')
+    header_parser.add_argument('-c',
+                               '--capacities',
+                               type=int,
+                               nargs='+',
+                               help='The transaction capacities of the blocks.',
+                               default=[1, 10, 100])
+    header_parser.add_argument('-r',
+                               '--repeat',
+                               type=int,
+                               help='The number of times every operation is timed.',
+                               default=1000)
+    header_parser.set_defaults(run=benchmark_header)
+
+    validation_parser = subparsers.add_parser('validation', help='Time full chain validation.')
+    validation_parser.add_argument('-n',
+                                   '--nodes',
+                                   type=int,
+                                   help='The number of wallets in the ring.',
+                                   default=5)
+    validation_parser.add_argument('-b',
+                                   '--blocks',
+                                   type=int,
+                                   help='The number of blocks in the chain.',
+                                   default=50)
+    validation_parser.add_argument('-c',
+                                   '--capacity',
+                                   type=int,
+                                   help='The transaction capacity of a block.',
+                                   default=10)
+    validation_parser.add_argument('-w',
+                                   '--workers',
+                                   type=int,
+                                   help='The number of verifier processes.',
+                                   default=os.cpu_count())
+    validation_parser.set_defaults(run=benchmark_validation)
+
+    keys_parser = subparsers.add_parser('keys', help='Compare the signature schemes of the wallets.')
+    keys_parser.add_argument('-t',
+                             '--types',
+                             nargs='+',
+                             choices=keys.KEY_TYPES,
+                             help='The signature schemes to compare.',
+                             default=list(keys.KEY_TYPES))
+    keys_parser.add_argument('-r',
+                             '--repeat',
+                             type=int,
+                             help='The number of times signing and verification are timed.',
+                             default=1000)
+    keys_parser.add_argument('--keygen-repeat',
+                             type=int,
+                             help='The number of keys generated to time key generation.',
+                             default=10)
+    keys_parser.set_defaults(run=benchmark_keys)
+
+    memory_parser = subparsers.add_parser('memory', help='Compare the memory of the transaction layouts for a long chain.')
+    memory_parser.add_argument('-n',
+                               '--nodes',
+                               type=int,
+                               help='The number of wallets in the ring.',
+                               default=5)
+    memory_parser.add_argument('-b',
+                               '--blocks',
+                               type=int,
+                               help='The number of blocks in the chain.',
+                               default=1000)
+    memory_parser.add_argument('-c',
+                               '--capacity',
+                               type=int,
+                               help='The transaction capacity of a block.',
+                               default=10)
+    memory_parser.set_defaults(run=benchmark_memory)
+
+    args = parser.parse_args()
+    args.run(args)
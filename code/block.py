@@ -1,24 +1,45 @@
 from transaction import Transaction
-from Crypto.Hash import SHA256
+from merkle import merkle_root
+import hashlib
+import struct
 import time
-import json
+
+# index, timestamp, previous hash, Merkle root, followed by the nonce
+HEADER = struct.Struct('<Id32s32s')
+NONCE = struct.Struct('<q')
+
+def hash_header(prefix, nonce):
+	# hashes a serialized header prefix followed by the nonce bytes
+	return hashlib.sha256(prefix + NONCE.pack(nonce)).hexdigest()
 
 class Block:
-	def __init__(self, index, transactions, previous_hash):
+	def __init__(self, index, transactions, previous_hash, timestamp=None):
 		# block initialization
 		self.index = index
-		self.timestamp = time.time()
+		self.timestamp = time.time() if timestamp is None else timestamp
 		self.transactions = transactions
+		self.merkle_root = merkle_root([t.transaction_id for t in transactions])
 		self.nonce = 0
 		self.previous_hash = previous_hash
 		self.current_hash = self.calc_hash()
+		self.checked_hash = None
+
+	def header_prefix(self):
+		# serializes every header field except the nonce, so miners can reuse it for every attempt
+		# the header has the same size for any number of transactions, they are covered by the Merkle root
+		return HEADER.pack(self.index, self.timestamp, bytes.fromhex(self.previous_hash), bytes.fromhex(self.merkle_root))
 
 	def calc_hash(self):
 		# calculates current hash of block
-		block_string = json.dumps({
-            "timestamp": self.timestamp,
-            "transactions": [t.transaction_id for t in self.transactions],
-			"nonce": self.nonce,
-            "previous_hash": self.previous_hash
-        }.__str__())
-		return SHA256.new(block_string.encode("ISO-8859-2")).hexdigest()
\ No newline at end of file
+		return hash_header(self.header_prefix(), self.nonce)
+
+	def verify_hash(self):
+		# checks the hash of the header and the Merkle root of the transactions, the result is cached for the checked hash
+		if self.checked_hash == self.current_hash:
+			return True
+		if self.current_hash != self.calc_hash():
+			return False
+		if self.merkle_root != merkle_root([t.transaction_id for t in self.transactions]):
+			return False
+		self.checked_hash = self.current_hash
+		return True
\ No newline at end of file
@@ -1,24 +1,254 @@
+from store import StoredBlocks
 from block import Block
+import config
+
+# results of Blockchain.receive
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+ORPHAN = 'orphan'
+SIDE = 'side'
+EXTENDED = 'extended'
+REORGANIZED = 'reorganized'
+
+# blocks whose parent is unknown, kept until the parent arrives
+ORPHAN_LIMIT = 100
+# blocks of side branches, the ones furthest from the tip are dropped first
+SIDE_LIMIT = 500
+# validated heights kept as checkpoints, the oldest are dropped first
+CHECKPOINT_LIMIT = 16
 
 class Blockchain:
-    def __init__(self):
-        # blockchain initialization
-        self.blocks = []
+    def __init__(self, store=None):
+        # blockchain initialization, blocks are kept in memory or in the given block store
+        self.store = store
+        self.blocks = StoredBlocks(store) if store is not None else []
+        self.transaction_index = {} # transaction id -> height of the block that contains it
+        self.address_index = {} # public key -> (height, position) of every confirmed transaction it sent or received, in chain order
+        self.side = {} # hash -> block that is not on the chain but links to it
+        self.orphans = {} # hash -> block whose parent is unknown
+        self.checkpoints = {} # height -> hash of a block whose chain was fully validated
+
+    def __getstate__(self):
+        # the indexes are not sent over the network, they are rebuilt by the receiver
+        state = self.__dict__.copy()
+        del state['transaction_index']
+        del state['address_index']
+        state['side'] = {}
+        state['orphans'] = {}
+        state['store'] = None
+        state['blocks'] = list(self.blocks)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rebuild_index()
 
     def add_block(self, block):
         # adds new validated block to the chain
         if self.validate_block(block):
             self.blocks.append(block)
+            self.index_block(block)
             return True
         return False
 
+    def add_genesis_block(self, block):
+        # adds the genesis block without validation
+        self.blocks.append(block)
+        self.index_block(block)
+
+    def reset(self, blocks):
+        # replaces every block of the chain with the given ones
+        if self.store is None:
+            self.blocks = list(blocks)
+        else:
+            del self.blocks[0:]
+            for block in blocks:
+                self.blocks.append(block)
+        self.rebuild_index()
+
+    def receive(self, block):
+        # adds a block to the tree of blocks and switches to the longest branch, returns (status, abandoned, connected)
+        # where abandoned are the blocks that left the chain and connected the ones that joined it, in chain order
+        if self.contains_block(block) or block.current_hash in self.orphans:
+            return (DUPLICATE, [], [])
+        if not block.verify_hash() or not self.meets_difficulty(block):
+            return (INVALID, [], [])
+        parent = self.find_block(block.index - 1, block.previous_hash)
+        if parent is None:
+            self.orphans[block.current_hash] = block
+            if len(self.orphans) > ORPHAN_LIMIT:
+                del self.orphans[next(iter(self.orphans))]
+            return (ORPHAN, [], [])
+        self.side[block.current_hash] = block
+
+        # orphans that link to the new block (or to their linked siblings) are no longer orphans
+        best = block
+        children = [block]
+        while children:
+            parent = children.pop()
+            for orphan in [o for o in self.orphans.values() if o.previous_hash == parent.current_hash]:
+                del self.orphans[orphan.current_hash]
+                if orphan.index != parent.index + 1:
+                    continue
+                self.side[orphan.current_hash] = orphan
+                children.append(orphan)
+                if orphan.index > best.index:
+                    best = orphan
+
+        if best.index <= len(self.blocks) - 1:
+            self.prune_side()
+            return (SIDE, [], [])
+        # switch to the branch of the best block, from the point where it forks off the chain
+        branch = [best]
+        while not self.on_chain(branch[-1].index - 1, branch[-1].previous_hash):
+            if branch[-1].previous_hash not in self.side:
+                # the start of the branch was pruned, it can only be synced with a peer
+                return (SIDE, [], [])
+            branch.append(self.side[branch[-1].previous_hash])
+        branch.reverse()
+        fork_height = branch[0].index - 1
+        abandoned = self.switch(fork_height, branch)
+        self.prune_side()
+        return (EXTENDED if len(abandoned) == 0 else REORGANIZED, abandoned, branch)
+
+    def switch(self, fork_height, branch):
+        # replaces the blocks after fork_height with the given branch, the replaced blocks become a side branch
+        abandoned = self.blocks[fork_height + 1:]
+        for block in reversed(abandoned):
+            self.unindex_block(block)
+            self.side[block.current_hash] = block
+        if self.store is None and len(abandoned) > 0:
+            # copy on write, readers that hold the previous list keep a consistent chain
+            self.blocks = self.blocks[:fork_height + 1] + branch
+        else:
+            # appending is atomic for readers, a stored chain is truncated and extended in place
+            del self.blocks[fork_height + 1:]
+            for block in branch:
+                self.blocks.append(block)
+        for block in branch:
+            self.side.pop(block.current_hash, None)
+            self.index_block(block)
+        return abandoned
+
+    def prune_side(self):
+        # drops the side blocks furthest from the tip once there are too many of them
+        if len(self.side) > SIDE_LIMIT:
+            for block in sorted(self.side.values(), key=lambda block: block.index)[:len(self.side) - SIDE_LIMIT]:
+                del self.side[block.current_hash]
+
+    def on_chain(self, height, hash):
+        # checks if the block at the given height of the chain has the given hash
+        return 0 <= height < len(self.blocks) and self.blocks[height].current_hash == hash
+
+    def contains_block(self, block):
+        # checks if a block is on the chain or on a side branch
+        return self.on_chain(block.index, block.current_hash) or block.current_hash in self.side
+
+    def find_block(self, height, hash):
+        # returns the block with the given hash if it is on the chain (at the given height) or on a side branch
+        if self.on_chain(height, hash):
+            return self.blocks[height]
+        return self.side.get(hash)
+
+    def index_block(self, block):
+        # adds the transactions of a block to the transaction and address indexes
+        for position, t in enumerate(block.transactions):
+            self.transaction_index[t.transaction_id] = block.index
+            for address in set([t.sender_address, t.receiver_address]):
+                self.address_index.setdefault(address, []).append((block.index, position))
+
+    def unindex_block(self, block):
+        # removes the transactions of the tip block from the indexes, their entries are the last ones of every address
+        for t in reversed(block.transactions):
+            self.transaction_index.pop(t.transaction_id, None)
+            for address in set([t.sender_address, t.receiver_address]):
+                entries = self.address_index.get(address)
+                if entries and entries[-1][0] == block.index:
+                    entries.pop()
+
+    def rebuild_index(self):
+        # rebuilds the transaction and address indexes from the blocks of the chain
+        self.transaction_index = {}
+        self.address_index = {}
+        for block in self.blocks:
+            self.index_block(block)
+
+    def history(self, address, offset=0, limit=20):
+        # returns the (height, position) of the confirmed transactions of an address, newest first, and their total number
+        entries = self.address_index.get(address, [])
+        total = len(entries)
+        end = max(total - offset, 0)
+        return (entries[max(end - limit, 0):end][::-1], total)
+
+    def contains_transaction(self, transaction_id):
+        # checks if a transaction is already on the chain
+        return transaction_id in self.transaction_index
+
+    def transaction_height(self, transaction_id):
+        # returns the height of the block that contains the transaction or None
+        return self.transaction_index.get(transaction_id)
+
+    def locator(self):
+        # hashes from the tip back to the genesis block, dense near the tip and exponentially sparser
+        locator = []
+        height = len(self.blocks) - 1
+        step = 1
+        while height > 0:
+            locator.append((height, self.blocks[height].current_hash))
+            if len(locator) >= 10:
+                step *= 2
+            height -= step
+        locator.append((0, self.blocks[0].current_hash))
+        return locator
+
+    def meets_difficulty(self, block):
+        # checks the proof of work of a block
+        return block.current_hash.startswith('0' * config.MINING_DIFFICULTY)
+
+    def validate_headers(self, previous, blocks):
+        # checks that the blocks link to previous and to each other and carry valid proofs of work, in order
+        # every header is cheap to check, so this runs on the calling thread
+        for block in blocks:
+            if block.index != previous.index + 1 or block.previous_hash != previous.current_hash:
+                return False
+            if not block.verify_hash() or not self.meets_difficulty(block):
+                return False
+            previous = block
+        return True
+
+    def validate_transactions(self, blocks, verifier):
+        # checks the hashes and signatures of every transaction of the blocks, spread across the verifier's pool
+        # the genesis transaction has no sender to sign it
+        transactions = [t for block in blocks if block.index > 0 for t in block.transactions]
+        return all(verifier.verify_batch(transactions))
+
+    def validate_suffix(self, fork_height, blocks, verifier):
+        # checks if the given blocks form a valid chain on top of the block at fork_height
+        return self.validate_headers(self.blocks[fork_height], blocks) and self.validate_transactions(blocks, verifier)
+
     def validate_block(self, block):
         # checks if a certain block of the chain is valid
-        return block.current_hash == block.calc_hash() and block.previous_hash == self.blocks[block.index - 1].current_hash
+        return block.verify_hash() and block.previous_hash == self.blocks[block.index - 1].current_hash
 
-    def validate_chain(self):
-        # checks if the chain is valid
-        for block in self.blocks[1:]:
-            if not self.validate_block(block):
-                return False
+    def last_checkpoint(self):
+        # returns the height of the latest checkpoint that is still on the chain, or 0 for the genesis block
+        heights = [height for (height, hash) in self.checkpoints.items() if self.on_chain(height, hash)]
+        return max(heights, default=0)
+
+    def add_checkpoint(self, height):
+        # trusts the chain up to the given height, the next validations start after it
+        self.checkpoints[height] = self.blocks[height].current_hash
+        while len(self.checkpoints) > CHECKPOINT_LIMIT:
+            del self.checkpoints[min(self.checkpoints)]
+
+    def validate_chain(self, verifier):
+        # checks the blocks after the latest checkpoint, and makes the tip a checkpoint if they are valid
+        if len(self.blocks) == 0:
+            return True
+        start = self.last_checkpoint()
+        if start == 0 and self.blocks[0].previous_hash != '0' * 64:
+            return False
+        if not self.validate_suffix(start, self.blocks[start + 1:], verifier):
+            return False
+        self.add_checkpoint(len(self.blocks) - 1)
         return True
\ No newline at end of file
@@ -1,7 +1,8 @@
 from transaction import Transaction
+from block import HEADER, hash_header
+from merkle import verify_proof
 import pyfiglet
 import requests
-import pickle
 import cmd
 
 class Noobcash(cmd.Cmd):
@@ -21,7 +22,7 @@ class Noobcash(cmd.Cmd):
             return
         try:
             response = requests.post('http://' + self.ip + ':' + self.port + '/create_new_transaction',
-                                    data=pickle.dumps((int(args[0]), int(args[1]))))
+                                    data={'receiver_id': int(args[0]), 'amount': int(args[1])})
             if response.status_code == 200:
                 print(f'Transaction of {args[1]} NBC coins to node{args[0]} completed successfully.')
             elif response.status_code == 402:
@@ -39,26 +40,90 @@ class Noobcash(cmd.Cmd):
         'View the transactions of the current last block of the blockchain.'
         try:
             response = requests.get('http://' + self.ip + ':' + self.port + '/view_last_transactions')
-            transactions = pickle.loads(response._content)
+            transactions = response.json()
             for i in range(len(transactions)):
                 print('Transaction', i)
                 print('Sender Address:')
-                print(transactions[i].sender_address)
+                print(transactions[i]['sender_address'])
                 print('Recipient Address:')
-                print(transactions[i].receiver_address)
-                print('Amount:', transactions[i].amount)
-                print('ID:', transactions[i].transaction_id)
+                print(transactions[i]['receiver_address'])
+                print('Amount:', transactions[i]['amount'])
+                print('ID:', transactions[i]['transaction_id'])
                 if i != len(transactions) - 1:
                     print('')
         except:
             print('Connection failed.')
 
-    def do_balance(self, _):
-        'Check your wallet balance.'
+    def do_balance(self, args):
+        'balance [node_id]\nCheck your wallet balance, or the balance of the node with the given ID.'
         try:
-            response = requests.get('http://' + self.ip + ':' + self.port + '/get_balance')
-            balance = pickle.loads(response._content)
-            print(f'You have {balance} NBC coins in your wallet.')
+            if args.strip() == '':
+                response = requests.get('http://' + self.ip + ':' + self.port + '/get_balance')
+                balance = response.json()['balance']
+                print(f'You have {balance} NBC coins in your wallet.')
+                return
+            response = requests.get('http://' + self.ip + ':' + self.port + '/address_balance', params={'id': int(args)})
+            if response.status_code != 200:
+                print(response.json()['message'])
+                return
+            print(f'Node{args.strip()} has {response.json()["balance"]} NBC coins.')
+        except:
+            print('Connection failed.')
+
+    def do_history(self, args):
+        'history <node_id> [page]\nView the transactions sent or received by the node with the given ID, newest first, 10 per page.'
+        args = args.split()
+        if len(args) == 0 or len(args) > 2:
+            print('Please provide <node_id> and optionally [page] to view the history.')
+            return
+        try:
+            page = int(args[1]) if len(args) == 2 else 1
+            response = requests.get('http://' + self.ip + ':' + self.port + '/history',
+                                    params={'id': int(args[0]), 'offset': (page - 1) * 10, 'limit': 10})
+            if response.status_code != 200:
+                print(response.json()['message'])
+                return
+            history = response.json()
+            for t in history['pending']:
+                print(f'pending     node{t["sender_id"]} -> node{t["receiver_id"]} {t["amount"]} NBC  {t["transaction_id"]}')
+            for t in history['confirmed']:
+                sender = 'genesis' if t['sender_id'] is None else f'node{t["sender_id"]}'
+                print(f'block {t["height"]:<5} {sender} -> node{t["receiver_id"]} {t["amount"]} NBC  {t["transaction_id"]}')
+            pages = max(1, (history['total'] + 9) // 10)
+            print(f'Page {page} of {pages} ({history["total"]} confirmed transactions).')
+        except:
+            print('Connection failed.')
+
+    def do_status(self, args):
+        'status <transaction_id>\nCheck if a transaction is pending or confirmed.'
+        try:
+            response = requests.get('http://' + self.ip + ':' + self.port + '/transaction_status', params={'transaction_id': args.strip()})
+            status = response.json()
+            if status['status'] == 'confirmed':
+                print(f'Confirmed in block {status["height"]} ({status["confirmations"]} confirmations).')
+            elif status['status'] == 'pending':
+                print('Pending, not in a block yet.')
+            else:
+                print('Unknown transaction.')
+        except:
+            print('Connection failed.')
+
+    def do_verify(self, args):
+        'verify <transaction_id>\nCheck that a transaction is on the blockchain, using only the header of its block and a Merkle proof.'
+        try:
+            response = requests.get('http://' + self.ip + ':' + self.port + '/merkle_proof', params={'transaction_id': args.strip()})
+            if response.status_code != 200:
+                print(response.json()['message'])
+                return
+            proof = response.json()
+            header = proof['header']
+            prefix = HEADER.pack(header['index'], header['timestamp'], bytes.fromhex(header['previous_hash']), bytes.fromhex(header['merkle_root']))
+            if hash_header(prefix, header['nonce']) != proof['hash']:
+                print('The header does not match the hash of the block.')
+            elif verify_proof(args.strip(), proof['proof'], header['merkle_root']):
+                print(f'The transaction is in block {header["index"]} ({proof["hash"]}).')
+            else:
+                print('The Merkle proof is invalid.')
         except:
             print('Connection failed.')
 
@@ -2,6 +2,23 @@ NUMBER_OF_NODES = None
 MINING_DIFFICULTY = None
 BLOCK_CAPACITY = None
 PORT = None
+MINING_ENGINE = 'process'
+MINING_WORKERS = None
+VERIFIER_WORKERS = None
+COIN_SELECTION = 'smallest_sufficient'
+MEMPOOL_SIZE = 10000
+MEMPOOL_WINDOW = 1
+DATA_DIR = None
+SNAPSHOT_INTERVAL = 50
+BATCH_BROADCAST = False
+BATCH_SIZE = 20
+BATCH_WINDOW = 0.05
+SERVER = 'flask'
+SERVER_WORKERS = 32
+INBOUND_LIMIT = 64
+UNDO_DEPTH = 100
+KEY_TYPE = 'rsa'
+KEY_FILE = None
 
 BOOTSTRAP_IP = '127.0.0.1'
 BOOTSTRAP_PORT = '5000'
@@ -1,135 +1,291 @@
 from flask import Blueprint, jsonify, request
-from threading import Thread, Lock, Event
-from copy import deepcopy
-from node import Node
-import pickle
+from threading import Thread
+import blockchain
+import merkle
 import config
+import wire
 import random
 import time
 
-node = Node()
+# the node served by rest_api, created by rest.py once the configuration is known
+node = None
 rest_api = Blueprint('rest_api', __name__)
 
+# every endpoint is a handler(node, data, values) that returns (payload, status), where payload
+# is a wire format message (bytes) or JSON data, so that any server can serve them
+ROUTES = []
+
+def route(path, method):
+    # registers a handler for the given path and method
+    def register(handler):
+        ROUTES.append((path, method, handler))
+        return handler
+    return register
+
+def handle(handler, node, data, values):
+    # calls a handler, rejecting payloads that are not valid wire format messages
+    try:
+        return handler(node, data, values)
+    except wire.WireError as error:
+        return {'message': str(error)}, 400
+
+def flask_view(handler):
+    # serves a handler with the node of this process
+    def view():
+        (payload, status) = handle(handler, node, request.get_data(), request.values)
+        if isinstance(payload, bytes):
+            return payload, status
+        return jsonify(payload), status
+    return view
+
 # ------------------------------------------
 # ------------- Node endpoints -------------
 # ------------------------------------------
 
-@rest_api.route('/register_node', methods=['POST'])
-def register_node():
+@route('/register_node', 'POST')
+def register_node(node, data, values):
     # registers node to the ring (only called by bootstrap node)
-    node_public_key = request.form.get('public_key')
-    node_ip = request.form.get('ip')
-    node_port = request.form.get('port')
+    node_public_key = values.get('public_key')
+    node_ip = values.get('ip')
+    node_port = values.get('port')
     node_id = len(node.ring)
 
-    node.register_node_to_ring(node_id, node_ip, node_port, node_public_key, 0, [])
+    node.register_node_to_ring(node_id, node_ip, node_port, node_public_key)
 
     if len(node.ring) == config.NUMBER_OF_NODES:
         # bootstrap node sends the ring and chain to all other nodes
         def init():
-            node.broadcast('/receive_ring_and_chain', obj=pickle.dumps((deepcopy(node.ring), deepcopy(node.chain))))
+            node.broadcast('/receive_ring_and_chain', obj=wire.encode_ring_and_chain(node.ring, node.chain.blocks))
+            node.save_snapshot()
             for n in node.ring:
-                if n['id'] != 0:
-                    node.create_transaction(n['public_key'], 100)
+                if n.id != 0:
+                    node.create_transaction(n.public_key, 100)
                     time.sleep(random.random() * 3)
 
         Thread(target=init).start()
-    return jsonify({'id': node_id}), 200
+    return {'id': node_id}, 200
 
-@rest_api.route('/receive_ring_and_chain', methods=['POST'])
-def receive_ring_and_chain():
+@route('/receive_ring_and_chain', 'POST')
+def receive_ring_and_chain(node, data, values):
     # receive bootstrap's node ring and chain, only called by bootstrap node on startup
-    (ring, chain) = pickle.loads(request.get_data())
-    node.ring = ring
-    node.chain = chain
-    return jsonify({'message': "OK"}), 200
+    (ring, blocks) = wire.decode_ring_and_chain(data)
+    if not node.load_ring_and_chain(ring, blocks):
+        return {'message': "The chain is invalid"}, 400
+    return {'message': "OK"}, 200
 
-@rest_api.route('/register_transaction', methods=['POST'])
-def register_transaction():
+@route('/register_transaction', 'POST')
+def register_transaction(node, data, values):
     # adds incoming transaction to block if valid
-    transaction = pickle.loads(request.get_data())
-    # check if transaction is already on the blockchain
-    new = True
-    for block in node.chain.blocks:
-        for t in block.transactions:
-            if transaction.transaction_id == t.transaction_id:
-                new = False
-    if node.validate_transaction(transaction) and new:
-        # update wallet UTXOs
-        node.update_wallet(transaction)
-        # update ring balance and utxos
-        node.update_ring(transaction)
-        # add transaction to block
-        node.pending_transactions.append(transaction)
-        return jsonify({'message': "OK"}), 200
-    else:
-        return jsonify({'message': "The transaction is invalid or is already on the blockchain"}), 401
-
-@rest_api.route('/register_block', methods=['POST'])
-def register_block():
-    # adds incoming block to the chain if valid
-    node.pause_thread.set()
-    node.block_lock.acquire()
-    block = pickle.loads(request.get_data())
-    if block.index == node.chain.blocks[-1].index + 1 and node.chain.add_block(block):
-        node.write_block_time()
-        # remove mutual transactions between pending and block
-        pending = set([t.transaction_id for t in node.pending_transactions])
-        block_transactions = set([t.transaction_id for t in block.transactions])
-        node.pending_transactions = [t for t in node.pending_transactions if t.transaction_id in (pending - block_transactions)]
-        transactions_to_register = [t for t in block.transactions if t.transaction_id in (block_transactions - pending)]
-        # for transactions that are not in pending list, register
-        for transaction in transactions_to_register:
-            # update wallet UTXOs
-            node.update_wallet(transaction)
-            # update ring balance and utxos
-            node.update_ring(transaction)
+    transaction = wire.decode_transaction(data, node.ring)
+    if node.receive_transaction(transaction):
+        return {'message': "OK"}, 200
     else:
-        node.resolve_conflicts()
-    node.block_lock.release()
-    node.pause_thread.clear()
-    return jsonify({'message': "OK"}), 200
+        return {'message': "The transaction is invalid or is already on the blockchain"}, 401
+
+@route('/register_transactions', 'POST')
+def register_transactions(node, data, values):
+    # adds a batch of incoming transactions to block, skipping the invalid ones
+    transactions = wire.decode_transactions(data, node.ring)
+    accepted = node.register_transactions(transactions)
+    return {'accepted': accepted, 'rejected': len(transactions) - accepted}, 200
+
+@route('/register_block', 'POST')
+def register_block(node, data, values):
+    # adds incoming block to the block tree, switching to its branch if it is the longest
+    block = wire.decode_block(data, node.ring)
+    # verify the signatures of the transactions that this node has not seen yet in one batch, before taking block_lock
+    transactions_to_register = [t for t in block.transactions if t.transaction_id not in node.mempool]
+    if not all(node.verify_batch(transactions_to_register)):
+        node.metrics.counter('blocks_rejected').inc()
+        return {'message': "The block contains invalid transactions"}, 401
+    # the miner is interrupted only if the block changes the tip
+    with node.block_lock:
+        status = node.connect_block(block)
+    if status == blockchain.INVALID:
+        return {'message': "The block is invalid"}, 400
+    if status == blockchain.ORPHAN:
+        # the parent usually arrives soon from another peer, the sync only downloads blocks if a peer is ahead
+        node.request_sync()
+        return {'message': "The parent of the block is unknown"}, 202
+    return {'message': "OK", 'status': status}, 200
+
+@route('/send_chain', 'GET')
+def send_chain(node, data, values):
+    # sends every block of the chain
+    return wire.encode_blocks(node.chain_view.range(0)), 200
+
+@route('/send_chain_tip', 'GET')
+def send_chain_tip(node, data, values):
+    # sends the id of this node, the height of its chain and the hash of its last block
+    tip = node.chain_view.tip
+    if tip is None:
+        return {'message': "The node has not received the chain yet."}, 503
+    return wire.encode_tip(node.id, tip.index, tip.current_hash), 200
+
+@route('/find_common_ancestor', 'POST')
+def find_common_ancestor(node, data, values):
+    # returns the height of the most recent block of the given locator that is on this chain
+    locator = wire.decode_locator(data)
+    return wire.encode_height(node.chain_view.find_common_ancestor(locator)), 200
+
+@route('/send_blocks', 'GET')
+def send_blocks(node, data, values):
+    # sends the blocks of the chain starting from the given height
+    start = values.get('start', default=0, type=int)
+    view = node.chain_view
+    if start < 0 or start > view.height + 1:
+        return {'message': "The start height must be between 0 and the height of the chain."}, 400
+    return wire.encode_blocks(view.range(start)), 200
 
-@rest_api.route('/send_chain_and_id', methods=['GET'])
-def send_chain_and_id():
-    # sends a copy of the chain and id of this node
-    return pickle.dumps((deepcopy(node.chain), deepcopy(node.id)))
+@route('/send_ring_and_pending_transactions', 'GET')
+def send_ring_and_pending_transactions(node, data, values):
+    # sends the ring and pending transactions of this node
+    return node.ledger_message(), 200
 
-@rest_api.route('/send_ring_and_pending_transactions', methods=['GET'])
-def send_ring_and_pending_transactions():
-    # sends a copy of the ring and pending transactions list of this node
-    return pickle.dumps((deepcopy(node.ring), deepcopy(node.pending_transactions)))
+@route('/peer_stats', 'GET')
+def peer_stats(node, data, values):
+    # returns the latency, retries and failures of the requests to every peer
+    return node.transport.stats(), 200
+
+@route('/merkle_proof', 'GET')
+def merkle_proof(node, data, values):
+    # returns the header of the block that contains a transaction and the proof that it is included in the block
+    transaction_id = values.get('transaction_id')
+    height = node.chain.transaction_height(transaction_id)
+    blocks = node.chain_view.range(height, height + 1) if height is not None else []
+    ids = [t.transaction_id for t in blocks[0].transactions] if len(blocks) > 0 else []
+    if transaction_id not in ids:
+        return {'message': "The transaction is not on the blockchain."}, 404
+    block = blocks[0]
+    return {
+        'header': {
+            'index': block.index,
+            'timestamp': block.timestamp,
+            'previous_hash': block.previous_hash,
+            'merkle_root': block.merkle_root,
+            'nonce': block.nonce
+        },
+        'hash': block.current_hash,
+        'proof': merkle.merkle_proof(ids, ids.index(transaction_id))
+    }, 200
+
+@route('/metrics', 'GET')
+def metrics(node, data, values):
+    # returns the counters, gauges and histograms of this node
+    return node.metrics.snapshot(), 200
+
+@route('/profiler', 'GET')
+def profiler(node, data, values):
+    # returns the most sampled stacks since the profiler was last started
+    return node.profiler.report(values.get('top', default=20, type=int)), 200
+
+@route('/profiler', 'POST')
+def toggle_profiler(node, data, values):
+    # starts or stops the sampling profiler, e.g. with action=start
+    action = values.get('action')
+    if action == 'start':
+        node.profiler.start()
+    elif action == 'stop':
+        node.profiler.stop()
+    else:
+        return {'message': "The action must be start or stop."}, 400
+    return node.profiler.report(values.get('top', default=20, type=int)), 200
 
 # ------------------------------------------
 # -------------- CLI endpoints -------------
 # ------------------------------------------
 
-@rest_api.route('/create_new_transaction', methods=['POST'])
-def create_new_transaction():
+@route('/create_new_transaction', 'POST')
+def create_new_transaction(node, data, values):
     # creates new transaction
-    (receiver_id, amount) = pickle.loads(request.get_data())
-    receiver_address = None
-    for n in node.ring:
-        if receiver_id == n['id']:
-            receiver_address = n['public_key']
+    receiver_id = values.get('receiver_id', type=int)
+    amount = values.get('amount', type=int)
+    if amount is None or amount <= 0:
+        return {'message': "Transaction failed. The amount must be a positive integer."}, 400
+    receiver = node.ring.get(receiver_id)
+    receiver_address = receiver.public_key if receiver is not None else None
     if receiver_address != None and receiver_address != node.wallet.public_key:
-        if node.create_transaction(receiver_address, amount):
-            return jsonify({'message': "OK"}), 200
+        transaction = node.create_transaction(receiver_address, amount)
+        if transaction:
+            return {'message': "OK", 'transaction_id': transaction.transaction_id}, 200
         else:
-            return jsonify({'message': "Transaction failed. Not enough coins or signature is invalid."}), 402
+            return {'message': "Transaction failed. Not enough coins or signature is invalid."}, 402
     elif receiver_address == None:
-        return jsonify({'message': "Transaction failed. There is no node with the given ID."}), 403
+        return {'message': "Transaction failed. There is no node with the given ID."}, 403
     else:
-        return jsonify({'message': "Transaction failed. You cannot send coins to yourself."}), 404
+        return {'message': "Transaction failed. You cannot send coins to yourself."}, 404
 
-@rest_api.route('/view_last_transactions', methods=['GET'])
-def view_last_transactions():
+@route('/view_last_transactions', 'GET')
+def view_last_transactions(node, data, values):
     # returns the transactions that are in the last validated block of the chain
-    return pickle.dumps(node.chain.blocks[-1].transactions)
+    return [{
+        'sender_address': t.sender_address,
+        'receiver_address': t.receiver_address,
+        'amount': t.amount,
+        'transaction_id': t.transaction_id
+    } for t in (node.chain_view.tip.transactions if node.chain_view.tip is not None else [])], 200
 
-@rest_api.route('/get_balance', methods=['GET'])
-def get_balance():
+@route('/get_balance', 'GET')
+def get_balance(node, data, values):
     # returns the balance of this node's wallet
-    for n in node.ring:
-        if n['id'] == node.id:
-            return pickle.dumps(n['balance'])
\ No newline at end of file
+    return {'balance': node.ledger_view.balance(node.wallet.public_key)}, 200
+
+def account_id(node, public_key):
+    # the id of the node that owns a key, or None for the genesis sender
+    account = node.ring.find(public_key)
+    return account.id if account is not None else None
+
+def describe_transaction(node, transaction):
+    return {
+        'transaction_id': transaction.transaction_id,
+        'sender_id': account_id(node, transaction.sender_address),
+        'receiver_id': account_id(node, transaction.receiver_address),
+        'amount': transaction.amount
+    }
+
+@route('/history', 'GET')
+def history(node, data, values):
+    # returns a page of the confirmed transactions of a node (newest first) and its pending ones
+    account = node.ring.get(values.get('id', type=int))
+    if account is None:
+        return {'message': "There is no node with the given ID."}, 404
+    offset = values.get('offset', default=0, type=int)
+    limit = min(values.get('limit', default=20, type=int), 100)
+    view = node.chain_view
+    (entries, total) = node.chain.history(account.public_key, offset, limit)
+    confirmed = []
+    for (height, position) in entries:
+        blocks = view.range(height, height + 1)
+        if len(blocks) == 0 or position >= len(blocks[0].transactions):
+            # the block was replaced after the page was read
+            continue
+        transaction = blocks[0].transactions[position]
+        confirmed.append(dict(describe_transaction(node, transaction), height=height))
+    pending = [describe_transaction(node, t) for t in node.mempool.transactions()
+               if account.public_key in (t.sender_address, t.receiver_address)]
+    return {'id': account.id, 'total': total, 'offset': offset, 'confirmed': confirmed, 'pending': pending}, 200
+
+@route('/address_balance', 'GET')
+def address_balance(node, data, values):
+    # returns the balance of any node, including its pending transactions
+    account = node.ring.get(values.get('id', type=int))
+    if account is None:
+        return {'message': "There is no node with the given ID."}, 404
+    return {'id': account.id, 'balance': node.ledger_view.balance(account.public_key)}, 200
+
+@route('/transaction_status', 'GET')
+def transaction_status(node, data, values):
+    # returns whether a transaction is confirmed (and at which height), pending or unknown
+    transaction_id = values.get('transaction_id')
+    height = node.chain.transaction_height(transaction_id)
+    if height is not None:
+        blocks = node.chain_view.range(height, height + 1)
+        block_hash = blocks[0].current_hash if len(blocks) > 0 else None
+        return {'status': 'confirmed', 'height': height, 'block_hash': block_hash,
+                'confirmations': node.chain_view.height - height + 1}, 200
+    if transaction_id in node.mempool:
+        return {'status': 'pending'}, 200
+    return {'status': 'unknown'}, 404
+
+for (path, method, handler) in ROUTES:
+    rest_api.add_url_rule(path, handler.__name__, flask_view(handler), methods=[method])
\ No newline at end of file
@@ -0,0 +1,117 @@
+from concurrent.futures import ProcessPoolExecutor
+from Crypto.Signature import pss, eddsa
+from Crypto.PublicKey import RSA, ECC
+from argparse import ArgumentParser
+from functools import lru_cache
+from Crypto.Hash import SHA256
+import os
+
+# signature schemes of the wallets, keys of any of them are accepted from other nodes
+KEY_TYPES = ('rsa', 'ed25519')
+RSA_BITS = 1024
+# number of parsed keys kept in memory
+KEY_CACHE_SIZE = 1024
+# default directory of the pre-generated key pools, one subdirectory per key type
+POOL_DIR = '../keys'
+
+def generate_key(key_type='rsa'):
+    # returns a new private key in PEM format
+    if key_type == 'ed25519':
+        return ECC.generate(curve='Ed25519').export_key(format='PEM')
+    return RSA.generate(RSA_BITS).exportKey().decode('ISO-8859-1')
+
+def import_key(pem):
+    # parses a PEM key of any supported type
+    try:
+        return RSA.importKey(pem.encode('ISO-8859-1'))
+    except ValueError:
+        return ECC.import_key(pem)
+
+def public_key(private_key):
+    # the public key (the address of a wallet) in PEM format
+    key = import_key(private_key).public_key()
+    if isinstance(key, RSA.RsaKey):
+        return key.exportKey().decode('ISO-8859-1')
+    return key.export_key(format='PEM')
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def load_signer(pem):
+    # parses a PEM key once and returns its signature scheme (RSA keys sign the SHA256 hash of the message)
+    key = import_key(pem)
+    if isinstance(key, RSA.RsaKey):
+        scheme = pss.new(key)
+        return (lambda message: scheme.sign(SHA256.new(message)),
+                lambda message, signature: scheme.verify(SHA256.new(message), signature))
+    scheme = eddsa.new(key, 'rfc8032')
+    return (scheme.sign, scheme.verify)
+
+def sign(private_key, message):
+    return load_signer(private_key)[0](message)
+
+def verify(address, message, signature):
+    # checks a signature with the public key of the given address
+    try:
+        load_signer(address)[1](message, signature)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+def load_or_create(key_file=None, key_type='rsa'):
+    # returns (private key, public key) from the key file, or new keys that are saved there if it does not exist
+    if key_file is not None and os.path.exists(key_file):
+        with open(key_file, 'r') as f:
+            private_key = f.read()
+    else:
+        private_key = generate_key(key_type)
+        if key_file is not None:
+            os.makedirs(os.path.dirname(key_file) or '.', exist_ok=True)
+            # only the owner can read the private key
+            with open(os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+                f.write(private_key)
+    return (private_key, public_key(private_key))
+
+class KeyPool:
+    def __init__(self, directory=POOL_DIR, key_type='rsa'):
+        # pre-generated key files key0.pem, key1.pem, ... so that large local clusters start without generating keys
+        self.directory = os.path.join(directory, key_type)
+        self.key_type = key_type
+
+    def path(self, i):
+        return os.path.join(self.directory, f'key{i}.pem')
+
+    def fill(self, count, workers=None):
+        # generates the missing keys of the first count files in parallel, returns how many were generated
+        missing = [i for i in range(count) if not os.path.exists(self.path(i))]
+        os.makedirs(self.directory, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for i, private_key in zip(missing, executor.map(generate_key, [self.key_type] * len(missing))):
+                with open(os.open(self.path(i), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+                    f.write(private_key)
+        return len(missing)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Pre-generate a pool of wallet keys for local clusters and simulations.')
+    parser.add_argument('-n',
+                        '--count',
+                        type=int,
+                        help='The number of keys in the pool.',
+                        required=True)
+    parser.add_argument('-t',
+                        '--type',
+                        choices=KEY_TYPES,
+                        default='rsa',
+                        help='The signature scheme of the keys.')
+    parser.add_argument('-o',
+                        '--output',
+                        default=POOL_DIR,
+                        help='The directory of the pools.')
+    parser.add_argument('-w',
+                        '--workers',
+                        type=int,
+                        default=None,
+                        help='The number of processes generating keys (defaults to the number of cores).')
+
+    args = parser.parse_args()
+    pool = KeyPool(args.output, args.type)
+    generated = pool.fill(args.count, args.workers)
+    print(f'{generated} keys generated, {args.count} keys in {pool.directory}.')
@@ -0,0 +1,289 @@
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from testing import Cluster, RESULTS_DIR, node_url, percentile
+from keys import KeyPool, KEY_TYPES
+from argparse import ArgumentParser
+from threading import Thread, Lock, Semaphore
+import requests
+import random
+import json
+import time
+import os
+
+class FileWorkload:
+    def __init__(self, nodes, seed):
+        # replays transactions{i}.txt of every node over and over
+        self.transactions = []
+        for i in range(nodes):
+            with open(f'../transactions/{nodes}nodes/transactions{i}.txt', 'r') as f:
+                self.transactions.append([(int(line.split(' ')[0][2]), int(line.split(' ')[1])) for line in f])
+        self.positions = [0] * nodes
+        self.lock = Lock()
+
+    def next(self, i):
+        with self.lock:
+            transaction = self.transactions[i][self.positions[i] % len(self.transactions[i])]
+            self.positions[i] += 1
+        return transaction
+
+class UniformWorkload:
+    def __init__(self, nodes, seed, amounts=(1, 5)):
+        # sends random amounts to recipients chosen uniformly among the other nodes
+        self.nodes = nodes
+        self.amounts = amounts
+        self.random = random.Random(seed)
+        self.lock = Lock()
+
+    def recipient(self, i):
+        receiver = self.random.randrange(self.nodes - 1)
+        return receiver if receiver < i else receiver + 1
+
+    def next(self, i):
+        with self.lock:
+            return (self.recipient(i), self.random.randint(*self.amounts))
+
+class HotSpotWorkload(UniformWorkload):
+    def __init__(self, nodes, seed, amounts=(1, 5), hot=0, fraction=0.8):
+        # sends a fraction of the transactions to one hot node and the rest uniformly
+        super().__init__(nodes, seed, amounts)
+        self.hot = hot
+        self.fraction = fraction
+
+    def next(self, i):
+        with self.lock:
+            if i != self.hot and self.random.random() < self.fraction:
+                return (self.hot, self.random.randint(*self.amounts))
+            return (self.recipient(i), self.random.randint(*self.amounts))
+
+WORKLOADS = {
+    'files': FileWorkload,
+    'uniform': UniformWorkload,
+    'hotspot': HotSpotWorkload
+}
+
+class Recorder:
+    def __init__(self):
+        # every request as (node, step, start, latency, status)
+        self.lock = Lock()
+        self.requests = []
+        self.dropped = {}
+
+    def record(self, i, step, start, latency, status):
+        with self.lock:
+            self.requests.append((i, step, start, latency, status))
+
+    def drop(self, i, step):
+        # a request that was due but could not be sent because every in-flight slot was taken
+        with self.lock:
+            self.dropped[(i, step)] = self.dropped.get((i, step), 0) + 1
+
+class LoadClient:
+    def __init__(self, i, workload, recorder, max_in_flight):
+        # submits transactions to node i over a pool of keep-alive connections
+        self.i = i
+        self.workload = workload
+        self.recorder = recorder
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight))
+        self.slots = Semaphore(max_in_flight)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def submit(self, step):
+        (receiver_id, amount) = self.workload.next(self.i)
+        start = time.time()
+        try:
+            response = self.session.post(node_url(self.i) + '/create_new_transaction',
+                                         data={'receiver_id': receiver_id, 'amount': amount})
+            status = response.status_code
+        except requests.RequestException:
+            status = 'error'
+        self.recorder.record(self.i, step, start, time.time() - start, status)
+
+    def run_closed(self, step, concurrency, duration):
+        # keeps `concurrency` requests in flight until the step ends
+        deadline = time.time() + duration
+        def loop():
+            while time.time() < deadline:
+                self.submit(step)
+        threads = [Thread(target=loop) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open(self, step, rate, duration):
+        # sends `rate` requests/sec on a fixed schedule, requests due while every slot is taken are dropped
+        start = time.time()
+        count = int(rate * duration)
+        futures = []
+        for k in range(count):
+            time.sleep(max(0, start + k / rate - time.time()))
+            if not self.slots.acquire(blocking=False):
+                self.recorder.drop(self.i, step)
+                continue
+            future = self.executor.submit(self.submit, step)
+            future.add_done_callback(lambda _: self.slots.release())
+            futures.append(future)
+        for future in futures:
+            future.result()
+
+def steps(args):
+    # the (label, mode, load) of every step of the profile
+    if args.profile == 'step':
+        return [(f'{c} in flight', 'closed', c) for c in args.concurrency]
+    rates = [args.start_rate + (args.end_rate - args.start_rate) * k / max(args.windows - 1, 1) for k in range(args.windows)]
+    return [(f'{rate:.1f}/s', 'open', rate) for rate in rates]
+
+def summarize(recorder, nodes, profile, duration, args):
+    # throughput, latency and status codes of every node in every step, and the highest sustainable throughput of every node
+    results = []
+    for (label, mode, load) in profile:
+        for i in range(nodes):
+            requests = [r for r in recorder.requests if r[0] == i and r[1] == label]
+            latencies = [r[3] for r in requests]
+            statuses = {}
+            for r in requests:
+                statuses[str(r[4])] = statuses.get(str(r[4]), 0) + 1
+            ok = statuses.get('200', 0)
+            results.append({
+                'step': label,
+                'node': i,
+                'offered': load if mode == 'open' else None,
+                'concurrency': load if mode == 'closed' else args.max_in_flight,
+                'requests': len(requests),
+                'dropped': recorder.dropped.get((i, label), 0),
+                'throughput': ok / duration,
+                'error_rate': 1 - ok / len(requests) if requests else 0,
+                'p50': percentile(latencies, 50),
+                'p99': percentile(latencies, 99),
+                'statuses': statuses
+            })
+    sustainable = {}
+    for result in results:
+        if result['error_rate'] <= args.max_error_rate and result['dropped'] == 0 and \
+                result['p99'] is not None and result['p99'] <= args.max_latency:
+            sustainable[result['node']] = max(sustainable.get(result['node'], 0), result['throughput'])
+    return results, sustainable
+
+def print_results(results, sustainable):
+    print(f'{"step":<14}{"node":>5}{"req":>7}{"drop":>6}{"tps":>9}{"p50 ms":>9}{"p99 ms":>9}  statuses')
+    for r in results:
+        p50 = f'{r["p50"] * 1000:.1f}' if r['p50'] is not None else '-'
+        p99 = f'{r["p99"] * 1000:.1f}' if r['p99'] is not None else '-'
+        print(f'{r["step"]:<14}{r["node"]:>5}{r["requests"]:>7}{r["dropped"]:>6}{r["throughput"]:>9.1f}{p50:>9}{p99:>9}  {r["statuses"]}')
+    for (node, tps) in sorted(sustainable.items()):
+        print(f'node{node}: {tps:.1f} transactions/sec sustained')
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Drive noobcash nodes at increasing load to find their maximum sustainable throughput.')
+    parser.add_argument('-n',
+                        '--nodes',
+                        type=int,
+                        help='The number of nodes, listening on consecutive ports from the bootstrap port.',
+                        required=True)
+    parser.add_argument('--launch',
+                        nargs=2,
+                        type=int,
+                        metavar=('DIFFICULTY', 'CAPACITY'),
+                        help='Start a local cluster with the given difficulty and capacity instead of using running nodes.')
+    parser.add_argument('-k',
+                        '--keys',
+                        choices=KEY_TYPES,
+                        default=None,
+                        help='Start the launched nodes with keys of this type from the pre-generated pool.')
+    parser.add_argument('-p',
+                        '--profile',
+                        choices=['step', 'ramp'],
+                        default='step',
+                        help='Step the number of in-flight requests, or ramp the request rate.')
+    parser.add_argument('-c',
+                        '--concurrency',
+                        type=int,
+                        nargs='+',
+                        default=[1, 2, 4, 8, 16],
+                        help='In-flight requests per node in every step of the step profile.')
+    parser.add_argument('--start-rate',
+                        type=float,
+                        default=1,
+                        help='Requests/sec per node at the start of the ramp.')
+    parser.add_argument('--end-rate',
+                        type=float,
+                        default=50,
+                        help='Requests/sec per node at the end of the ramp.')
+    parser.add_argument('--windows',
+                        type=int,
+                        default=10,
+                        help='The number of constant-rate windows the ramp is split into.')
+    parser.add_argument('--max-in-flight',
+                        type=int,
+                        default=32,
+                        help='Connections and in-flight requests per node in the ramp profile.')
+    parser.add_argument('-t',
+                        '--step-time',
+                        type=float,
+                        default=10,
+                        help='Seconds of every step or window.')
+    parser.add_argument('-w',
+                        '--workload',
+                        choices=list(WORKLOADS),
+                        default='uniform',
+                        help='The recipients and amounts of the transactions.')
+    parser.add_argument('--hot-fraction',
+                        type=float,
+                        default=0.8,
+                        help='The fraction of the transactions sent to node 0 by the hotspot workload.')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='The seed of the synthetic workloads.')
+    parser.add_argument('--max-error-rate',
+                        type=float,
+                        default=0.01,
+                        help='The highest error rate of a sustainable step.')
+    parser.add_argument('--max-latency',
+                        type=float,
+                        default=1,
+                        help='The highest p99 latency (seconds) of a sustainable step.')
+    parser.add_argument('-o',
+                        '--output',
+                        default=None,
+                        help='A JSON file for the results.')
+    parser.add_argument('node_args',
+                        nargs='*',
+                        help='Extra arguments passed to every launched node after --, e.g. -- -s asyncio.')
+
+    args = parser.parse_args()
+    if args.workload == 'hotspot':
+        workload = HotSpotWorkload(args.nodes, args.seed, fraction=args.hot_fraction)
+    else:
+        workload = WORKLOADS[args.workload](args.nodes, args.seed)
+
+    cluster = None
+    if args.launch:
+        key_pool = KeyPool(key_type=args.keys) if args.keys else None
+        cluster = Cluster(args.nodes, args.launch[0], args.launch[1], args.node_args, os.path.join(RESULTS_DIR, 'logs', 'loadgen'), key_pool)
+        cluster.start()
+    try:
+        recorder = Recorder()
+        in_flight = max(args.concurrency) if args.profile == 'step' else args.max_in_flight
+        clients = [LoadClient(i, workload, recorder, in_flight) for i in range(args.nodes)]
+        profile = steps(args)
+        for (label, mode, load) in profile:
+            print(f'Step {label}...')
+            if mode == 'closed':
+                threads = [Thread(target=client.run_closed, args=(label, load, args.step_time)) for client in clients]
+            else:
+                threads = [Thread(target=client.run_open, args=(label, load, args.step_time)) for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        if cluster is not None:
+            cluster.stop()
+
+    results, sustainable = summarize(recorder, args.nodes, profile, args.step_time, args)
+    print_results(results, sustainable)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'args': vars(args), 'steps': results, 'sustainable': sustainable}, file, indent=4)
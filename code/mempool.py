@@ -0,0 +1,118 @@
+from threading import Lock
+import time
+
+class Mempool:
+    def __init__(self, max_size=None, on_evict=None, window=1, clock=time.time):
+        # pending transactions indexed by id and grouped by arrival window, oldest window first
+        # within a window the optional priority breaks ties, every group keeps arrival order
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.window = window
+        self.clock = clock
+        self.keys = {}
+        self.buckets = {}
+        # output id -> id of the pending transaction that created it, and input id -> id of the pending transaction that spends it
+        self.creators = {}
+        self.spenders = {}
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self.keys
+
+    def __iter__(self):
+        return iter(self.transactions())
+
+    def add(self, transaction, priority=0, arrival=None, evict=True):
+        # adds a transaction, returns False if it is a duplicate or the pool is full of transactions that would be mined before it
+        # (or just full, if evict is False)
+        evicted = None
+        key = (int((self.clock() if arrival is None else arrival) // self.window), -priority)
+        with self.lock:
+            if transaction.transaction_id in self.keys:
+                return False
+            if self.max_size is not None and len(self.keys) >= self.max_size:
+                if not evict:
+                    return False
+                # evict the transaction that would be mined last, unless a pending transaction or the new one spends its outputs
+                evicted = self._last(set(input.id for input in transaction.transaction_inputs))
+                if evicted is None or key >= self.keys[evicted.transaction_id]:
+                    return False
+                self._remove(evicted.transaction_id)
+            self.keys[transaction.transaction_id] = key
+            self.buckets.setdefault(key, {})[transaction.transaction_id] = transaction
+            for output in transaction.transaction_outputs:
+                self.creators[output.id] = transaction.transaction_id
+            for input in transaction.transaction_inputs:
+                self.spenders[input.id] = transaction.transaction_id
+        if evicted is not None and self.on_evict is not None:
+            self.on_evict(evicted)
+        return True
+
+    def _last(self, spent):
+        # the newest transaction of the last group that neither a pending transaction nor the given inputs depend on
+        for key in sorted(self.buckets, reverse=True):
+            for transaction in reversed(list(self.buckets[key].values())):
+                if not any(output.id in self.spenders or output.id in spent for output in transaction.transaction_outputs):
+                    return transaction
+        return None
+
+    def get(self, transaction_id):
+        # returns the pending transaction with the given id or None
+        with self.lock:
+            key = self.keys.get(transaction_id)
+            if key is None:
+                return None
+            return self.buckets[key][transaction_id]
+
+    def remove(self, transaction_ids):
+        # removes the given transactions (e.g. the ones confirmed in a block) and returns them
+        with self.lock:
+            removed = [self._remove(transaction_id) for transaction_id in transaction_ids]
+        return [t for t in removed if t is not None]
+
+    def _remove(self, transaction_id):
+        key = self.keys.pop(transaction_id, None)
+        if key is None:
+            return None
+        bucket = self.buckets[key]
+        transaction = bucket.pop(transaction_id)
+        if len(bucket) == 0:
+            del self.buckets[key]
+        for output in transaction.transaction_outputs:
+            if self.creators.get(output.id) == transaction_id:
+                del self.creators[output.id]
+        for input in transaction.transaction_inputs:
+            if self.spenders.get(input.id) == transaction_id:
+                del self.spenders[input.id]
+        return transaction
+
+    def peek(self, count=None):
+        # returns up to count (by default all) transactions in the order they would be mined
+        # a transaction comes after the pending transactions whose outputs it spends, even if it arrived before them
+        selected = []
+        with self.lock:
+            done = set()
+            waiting = {}
+            for key in sorted(self.buckets):
+                for transaction in self.buckets[key].values():
+                    ready = [transaction]
+                    while len(ready) > 0:
+                        if count is not None and len(selected) == count:
+                            return selected
+                        transaction = ready.pop(0)
+                        parent = next((self.creators[input.id] for input in transaction.transaction_inputs
+                                       if input.id in self.creators and self.creators[input.id] not in done), None)
+                        if parent is not None:
+                            waiting.setdefault(parent, []).append(transaction)
+                            continue
+                        selected.append(transaction)
+                        done.add(transaction.transaction_id)
+                        ready.extend(waiting.pop(transaction.transaction_id, []))
+        return selected
+
+    def transactions(self):
+        # returns every pending transaction in the order they would be mined
+        return self.peek()
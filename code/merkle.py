@@ -0,0 +1,50 @@
+import hashlib
+
+# root of a block without transactions
+EMPTY_ROOT = bytes(32)
+
+LEFT = 'left'
+RIGHT = 'right'
+
+def hash_pair(left, right):
+    return hashlib.sha256(left + right).digest()
+
+def next_level(level):
+    # hashes every pair of nodes, the last node is paired with itself if the level is odd
+    if len(level) % 2 == 1:
+        level = level + [level[-1]]
+    return [hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+def merkle_root(transaction_ids):
+    # returns the root (hex) of the Merkle tree over the given transaction ids (hex)
+    level = [bytes.fromhex(id) for id in transaction_ids]
+    if len(level) == 0:
+        return EMPTY_ROOT.hex()
+    while len(level) > 1:
+        level = next_level(level)
+    return level[0].hex()
+
+def merkle_proof(transaction_ids, index):
+    # returns the sibling hashes from the leaf at index up to the root, as (hash, side of the sibling) pairs
+    level = [bytes.fromhex(id) for id in transaction_ids]
+    proof = []
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level = level + [level[-1]]
+        if index % 2 == 0:
+            proof.append((level[index + 1].hex(), RIGHT))
+        else:
+            proof.append((level[index - 1].hex(), LEFT))
+        level = next_level(level)
+        index //= 2
+    return proof
+
+def verify_proof(transaction_id, proof, root):
+    # checks that a transaction id is a leaf of the tree with the given root
+    node = bytes.fromhex(transaction_id)
+    for (sibling, side) in proof:
+        if side == LEFT:
+            node = hash_pair(bytes.fromhex(sibling), node)
+        else:
+            node = hash_pair(node, bytes.fromhex(sibling))
+    return node.hex() == root
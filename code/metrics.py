@@ -0,0 +1,150 @@
+from threading import Lock
+import bisect
+import time
+
+# upper bounds (in seconds) of the buckets of latency histograms
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+class Counter:
+    def __init__(self):
+        # a value that only goes up
+        self.lock = Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+class Gauge:
+    def __init__(self, function=None):
+        # a value that is set, or read from a function when the metrics are collected
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.function() if self.function is not None else self.value
+
+class Timer:
+    def __init__(self, histogram):
+        # measures the seconds spent in a with block
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        # counts of the observed values per bucket, plus one bucket for the values above the last bound
+        self.lock = Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def time(self):
+        return Timer(self)
+
+    def quantile(self, q):
+        # estimates a quantile by the upper bound of the bucket it falls in
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'count': self.count,
+                'sum': self.sum,
+                'average': self.sum / self.count if self.count else 0,
+                'max': self.max,
+                'p50': self.quantile(0.5) if self.count else 0,
+                'p99': self.quantile(0.99) if self.count else 0,
+                'buckets': {str(bound): count for bound, count in zip(self.buckets + ('inf',), self.counts)}
+            }
+
+class TimedLock:
+    def __init__(self, wait, contended):
+        # a lock that records how long acquire waited whenever the lock was already held
+        self.lock = Lock()
+        self.wait = wait
+        self.contended = contended
+
+    def acquire(self, blocking=True, timeout=-1):
+        # the uncontended path is a single try, only waits are timed
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        self.contended.inc()
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.wait.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class Registry:
+    def __init__(self):
+        # metrics by name, created on first use
+        self.lock = Lock()
+        self.metrics = {}
+
+    def get(self, name, cls, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.setdefault(name, cls(*args))
+        return metric
+
+    def counter(self, name):
+        return self.get(name, Counter)
+
+    def gauge(self, name, function=None):
+        return self.get(name, Gauge, function)
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS):
+        return self.get(name, Histogram, buckets)
+
+    def timed_lock(self, name):
+        # creates a lock whose waits are recorded as <name>_lock_wait_seconds and <name>_lock_contended
+        return TimedLock(self.histogram(name + '_lock_wait_seconds'), self.counter(name + '_lock_contended'))
+
+    def snapshot(self):
+        # returns the current value of every metric by name
+        with self.lock:
+            metrics = list(self.metrics.items())
+        return {name: metric.snapshot() for name, metric in sorted(metrics)}
@@ -0,0 +1,164 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from abc import ABC, abstractmethod
+from argparse import ArgumentParser
+import multiprocessing
+import hashlib
+import time
+import os
+
+# number of nonces a worker tries between checks of the stop flag
+BATCH_SIZE = 20000
+# seconds between checks of the pause flag while workers are searching
+POLL_INTERVAL = 0.05
+
+_stop = None
+
+def difficulty_target(difficulty):
+    # a hex digest starts with `difficulty` zeros iff the digest is below this value
+    return 1 << (256 - 4 * difficulty)
+
+def search_nonce(prefix, start, step, difficulty, stop):
+    # tries nonces start, start + step, ... until one meets the difficulty or stop is set
+    target = difficulty_target(difficulty)
+    base = hashlib.sha256(prefix)
+    nonce = start
+    attempts = 0
+    while not stop.is_set():
+        for _ in range(BATCH_SIZE):
+            h = base.copy()
+            h.update(nonce.to_bytes(8, 'little'))
+            if int.from_bytes(h.digest(), 'big') < target:
+                return nonce, attempts + 1
+            attempts += 1
+            nonce += step
+    return None, attempts
+
+def _init_worker(stop):
+    # stores the shared stop flag in every worker process
+    global _stop
+    _stop = stop
+
+def _search_worker(prefix, start, step, difficulty):
+    return search_nonce(prefix, start, step, difficulty, _stop)
+
+class Miner(ABC):
+    def __init__(self):
+        # statistics of the mining engine
+        self.hash_rate = 0
+        self.total_hashes = 0
+        self.total_time = 0
+
+    def mine(self, block, difficulty, pause):
+        # mines the given block, returns False if pause was set before a nonce was found
+        start = time.time()
+        nonce, attempts = self.search(block.header_prefix(), block.nonce, difficulty, pause)
+        self.record(attempts, time.time() - start)
+        if nonce is None:
+            return False
+        block.nonce = nonce
+        block.current_hash = block.calc_hash()
+        block.checked_hash = block.current_hash
+        return True
+
+    @abstractmethod
+    def search(self, prefix, start, difficulty, pause):
+        # returns (nonce, attempts), where nonce is None if pause was set first
+        pass
+
+    def record(self, attempts, elapsed):
+        # updates hashes/sec of the last run and the totals
+        self.total_hashes += attempts
+        self.total_time += elapsed
+        if elapsed > 0:
+            self.hash_rate = attempts / elapsed
+
+    def average_hash_rate(self):
+        # hashes/sec over every run of this engine
+        if self.total_time == 0:
+            return 0
+        return self.total_hashes / self.total_time
+
+    def shutdown(self):
+        pass
+
+class SerialMiner(Miner):
+    def __init__(self, workers=None):
+        # runs on the mining thread, the number of workers is ignored
+        super().__init__()
+
+    def search(self, prefix, start, difficulty, pause):
+        # searches the nonce space on the calling thread
+        return search_nonce(prefix, start, 1, difficulty, pause)
+
+class ProcessPoolMiner(Miner):
+    def __init__(self, workers=None):
+        # the pool is started on the first block, so importing a node never forks
+        super().__init__()
+        self.workers = workers or os.cpu_count() or 1
+        self.context = multiprocessing.get_context('spawn')
+        self.stop = self.context.Event()
+        self.pool = None
+
+    def search(self, prefix, start, difficulty, pause):
+        # splits the nonce space in interleaved slices, one for every worker
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.context,
+                                            initializer=_init_worker, initargs=(self.stop,))
+        self.stop.clear()
+        futures = [self.pool.submit(_search_worker, prefix, start + i, self.workers, difficulty)
+                   for i in range(self.workers)]
+        nonce = None
+        pending = set(futures)
+        while pending and nonce is None and not pause.is_set():
+            done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result()[0] is not None:
+                    nonce = future.result()[0]
+        # stop the remaining workers and count their attempts
+        self.stop.set()
+        wait(futures)
+        self.stop.clear()
+        return nonce, sum(future.result()[1] for future in futures)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+ENGINES = {
+    'serial': SerialMiner,
+    'process': ProcessPoolMiner
+}
+
+def create_miner(engine='process', workers=None):
+    # creates a mining engine by name
+    return ENGINES[engine](workers)
+
+if __name__ == "__main__":
+    from threading import Event
+    from block import Block
+
+    parser = ArgumentParser(description='Compare the hash rate of the mining engines.')
+    parser.add_argument('-d',
+                        '--difficulty',
+                        type=int,
+                        help='The mining difficulty of the test blocks.',
+                        default=5)
+    parser.add_argument('-b',
+                        '--blocks',
+                        type=int,
+                        help='The number of blocks to mine with every engine.',
+                        default=3)
+    parser.add_argument('-w',
+                        '--workers',
+                        type=int,
+                        help='The number of worker processes of the process engine.',
+                        default=None)
+
+    args = parser.parse_args()
+    for name in ENGINES:
+        miner = create_miner(name, args.workers)
+        for i in range(args.blocks):
+            miner.mine(Block(i, [], '0' * 64), args.difficulty, Event())
+        print(f'{name}: {miner.average_hash_rate():.0f} H/s')
+        miner.shutdown()
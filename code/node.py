@@ -1,240 +1,563 @@
-from requests.adapters import HTTPAdapter, Retry
-from threading import Thread, Lock, Event
-from transaction import Transaction
-from blockchain import Blockchain
-from copy import deepcopy
-import concurrent.futures
+from threading import Thread, Event, Condition
+from transaction import Transaction, TxInput
+from blockchain import Blockchain, EXTENDED, REORGANIZED
+from miner import create_miner
+from verifier import Verifier
 from wallet import Wallet
 from block import Block
+from mempool import Mempool
+from ring import Ring, fingerprint
+from store import BlockStore
+from transport import PeerTransport
+from metrics import Registry
+from profiler import Profiler
+from view import ChainView, LedgerView
 import requests
 import config
-import pickle
+import wire
 import time
 
-def poll_endpoint(url, request_type='post', data=None):
-	s = requests.Session()
-	r = None
-	retries = Retry(total=5, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
-	s.mount('http://', HTTPAdapter(max_retries=retries))
-	if request_type == 'post':
-		r = s.post(url, data=data)
-	else:
-		r = s.get(url, data=data)
-	return r
-
 class Node:
-	def __init__(self, id=None):
+	def __init__(self, id=None, transport=None, verifier=None, clock=time.time, threads=True, wallet=None):
+		# the transport, verifier, clock and wallet can be replaced (e.g. by the simulator), which also drives the node without its threads
 		self.id = id
-		self.chain = Blockchain()
-		self.wallet = Wallet()
-		self.pending_transactions = []
-		self.ring = [] # here we store id, address(ip:port), public key, and balance for every node
-		self.node_lock = Lock()
-		self.block_lock = Lock()
-		self.block_time_lock = Lock()
-		self.validated_transactions_lock = Lock()
+		self.clock = clock
+		self.metrics = Registry()
+		self.store = BlockStore(config.DATA_DIR) if config.DATA_DIR else None
+		self.chain = Blockchain(self.store)
+		self.wallet = wallet if wallet is not None else Wallet(config.KEY_FILE, config.KEY_TYPE)
+		self.miner = create_miner(config.MINING_ENGINE, config.MINING_WORKERS)
+		self.verifier = verifier if verifier is not None else Verifier(config.VERIFIER_WORKERS)
+		self.transport = transport if transport is not None else PeerTransport(config.NUMBER_OF_NODES)
+		self.mempool = Mempool(config.MEMPOOL_SIZE, self.revert_transaction, config.MEMPOOL_WINDOW, clock)
+		self.ring = Ring()
+		self.undo = {} # transaction id -> outputs it spent, for pending transactions and the last UNDO_DEPTH blocks
+		self.spent_by = {} # output id -> id of the transaction with an undo record that spent it
+		# node_lock guards the ledger (ring, wallet, mempool and undo records), block_lock guards the block tree
+		# readers use the published views instead of locks
+		self.node_lock = self.metrics.timed_lock('node')
+		self.block_lock = self.metrics.timed_lock('block')
+		self.chain_view = ChainView(self.chain.blocks)
+		self.ledger_view = LedgerView(self.ring, 0, 0)
+		self.ledger_cache = (0, None)
 		self.mine_thread = Thread(target=self.mining_handler)
-		self.pause_thread = Event()
-		self.mine_thread.start()
+		self.interrupt = Event()
+		self.miner_wakeup = Condition()
+		self.idle_time = 0
+		self.mining_time = 0
+		self.outbox = []
+		self.outbox_ready = Condition()
+		self.sync_needed = Event()
+		self.metrics.gauge('mempool_size', lambda: len(self.mempool))
+		self.metrics.gauge('chain_height', lambda: self.chain_view.height)
+		self.metrics.gauge('mining_hash_rate', lambda: self.miner.hash_rate)
+		self.metrics.gauge('mining_utilization', lambda: self.miner_stats()['utilization'])
+		self.profiler = Profiler()
+		if threads:
+			self.mine_thread.start()
+			Thread(target=self.sync_handler, daemon=True).start()
+			if config.BATCH_BROADCAST:
+				Thread(target=self.batch_handler, daemon=True).start()
 
 	def create_genesis_block(self):
 		# creates the genesis block (only called by bootstrap node on start-up)
 		first_transaction = Transaction('0', self.wallet.public_key, 100 * config.NUMBER_OF_NODES, [], self.wallet.private_key)
-		self.wallet.UTXOs.append(first_transaction.transaction_outputs[1])
-		genesis_block = Block(0, [first_transaction], 1)
-		self.chain.blocks.append(genesis_block)
+		self.wallet.UTXOs.add(first_transaction.transaction_outputs[1])
+		genesis_block = Block(0, [first_transaction], '0' * 64, self.clock())
+		with self.block_lock:
+			self.chain.add_genesis_block(genesis_block)
+			self.publish_chain()
 
-	def register_node_to_ring(self, id, ip, port, public_key, balance, utxos):
+	def register_node_to_ring(self, id, ip, port, public_key, utxos=()):
 		# adds this node to the ring (called only by bootstrap node)
-		self.ring.append({
-			'id': id,
-            'ip': ip,
-            'port': port,
-            'public_key': public_key,
-            'balance': balance,
-			'utxos': utxos
-        })
+		with self.node_lock:
+			self.ring.add(id, ip, port, public_key, utxos)
+			self.publish_ledger()
+
+	def load_ring_and_chain(self, ring, blocks):
+		# replaces the ring and chain with the ones of the bootstrap node if the chain is valid
+		with self.block_lock:
+			self.chain.reset(blocks)
+			if not self.chain.validate_chain(self.verifier):
+				self.chain.reset([])
+				self.publish_chain()
+				return False
+			self.publish_chain()
+			with self.node_lock:
+				self.ring = ring
+				self.publish_ledger()
+				self.save_snapshot()
+		return True
+
+	def publish_chain(self):
+		# publishes the chain for the readers (caller holds block_lock)
+		self.chain_view = ChainView(self.chain.blocks)
+
+	def publish_ledger(self):
+		# publishes the balances and the number of pending transactions for the readers (caller holds node_lock)
+		self.ledger_view = LedgerView(self.ring, len(self.mempool), self.ledger_view.version + 1)
+
+	def ledger_message(self):
+		# the ring and pending transactions in wire format, encoded once for every published version of the ledger
+		(version, message) = self.ledger_cache
+		if version != self.ledger_view.version:
+			with self.node_lock:
+				version = self.ledger_view.version
+				message = wire.encode_ring_and_transactions(self.ring, self.mempool.transactions())
+			self.ledger_cache = (version, message)
+		return message
 
 	def create_transaction(self, receiver_address, amount):
-		# creates a new transaction
+		# creates a new transaction, returns it or False if it failed
 		self.node_lock.acquire()
-		transaction_inputs = []
-		backup = []
-		balance = 0
-		if self.wallet.wallet_balance() >= amount:
-			while balance < amount:
-				utxo = self.wallet.UTXOs.pop()
-				balance += utxo['value']
-				input = {
-					'id': utxo['id'],
-					'value': utxo['value']
-				}
-				transaction_inputs.append(input)
-				backup.append(utxo)
-		else:
+		backup = self.wallet.UTXOs.select(self.wallet.key_id, amount, config.COIN_SELECTION)
+		if backup is None:
 			self.node_lock.release()
 			return False
+		transaction_inputs = []
+		for utxo in backup:
+			self.wallet.UTXOs.spend(utxo.id)
+			transaction_inputs.append(TxInput(utxo.id, utxo.value))
 		new_transaction = Transaction(self.wallet.public_key, receiver_address, amount, transaction_inputs, self.wallet.private_key)
 
-		if self.validate_transaction(new_transaction):
-			self.write_validated_transactions()
+		# add transaction to the mempool if valid and there is room for it
+		if self.validate_transaction(new_transaction) and self.mempool.add(new_transaction, new_transaction.amount):
 			# update wallet UTXOs
 			self.update_wallet(new_transaction)
 			# update ring balance and utxos
 			self.update_ring(new_transaction)
-			# add transaction to block
-			self.pending_transactions.append(new_transaction)
-			transaction_pickled = pickle.dumps(new_transaction)
-			Thread(target=self.broadcast, args=('/register_transaction', deepcopy(transaction_pickled))).start()
+			self.metrics.counter('transactions_created').inc()
+			self.publish_ledger()
+			self.notify_miner()
+			self.send_transaction(new_transaction)
 			self.node_lock.release()
-			return True
+			return new_transaction
 		else:
 			# if transaction is invalid revert UTXOs
-			self.wallet.UTXOs.extend(backup)
+			for utxo in backup:
+				self.wallet.UTXOs.add(utxo)
 			self.node_lock.release()
 			return False
 
+	def send_transaction(self, transaction):
+		# sends a new transaction to the other nodes, or queues it for the next batch
+		if not config.BATCH_BROADCAST:
+			self.gossip('/register_transaction', wire.encode_transaction(transaction))
+			return
+		with self.outbox_ready:
+			self.outbox.append(transaction)
+			self.outbox_ready.notify()
+
+	def batch_handler(self):
+		# sends the queued transactions in one request per peer, once BATCH_SIZE of them are queued or BATCH_WINDOW seconds after the first one
+		while True:
+			with self.outbox_ready:
+				self.outbox_ready.wait_for(lambda: len(self.outbox) > 0)
+				self.outbox_ready.wait_for(lambda: len(self.outbox) >= config.BATCH_SIZE, timeout=config.BATCH_WINDOW)
+				batch = self.outbox
+				self.outbox = []
+			self.gossip('/register_transactions', wire.encode_transactions(batch))
+
+	def register_transaction(self, transaction):
+		# adds a transaction received from another node to the mempool if it is new and valid (caller holds node_lock)
+		# check if transaction is already on the blockchain
+		if self.chain.contains_transaction(transaction.transaction_id):
+			return False
+		# the mempool rejects duplicates and transactions that do not fit
+		if not self.validate_transaction(transaction) or not self.mempool.add(transaction, transaction.amount):
+			return False
+		# update wallet UTXOs
+		self.update_wallet(transaction)
+		# update ring balance and utxos
+		self.update_ring(transaction)
+		self.notify_miner()
+		return True
+
+	def receive_transaction(self, transaction):
+		# registers a single transaction received from another node
+		with self.node_lock:
+			registered = self.register_transaction(transaction)
+			if registered:
+				self.publish_ledger()
+		return registered
+
+	def register_transactions(self, transactions):
+		# registers a batch of transactions under a single acquisition of node_lock, returns how many were accepted
+		# signatures are checked in one batch before taking the lock, the verifier remembers the valid ones
+		self.verify_batch(transactions)
+		with self.node_lock:
+			accepted = sum(1 for transaction in transactions if self.register_transaction(transaction))
+			if accepted > 0:
+				self.publish_ledger()
+		return accepted
+
 	def update_wallet(self, transaction):
 		# update wallet UTXOs
 		if self.wallet.public_key == transaction.sender_address:
-			self.wallet.UTXOs.append(transaction.transaction_outputs[0])
+			# inputs of transactions created by this node are already spent, unless they are replayed from the chain
+			for input in transaction.transaction_inputs:
+				self.wallet.UTXOs.spend(input.id)
+			self.wallet.UTXOs.add(transaction.transaction_outputs[0])
 		elif self.wallet.public_key == transaction.receiver_address:
-			self.wallet.UTXOs.append(transaction.transaction_outputs[1])
+			self.wallet.UTXOs.add(transaction.transaction_outputs[1])
 
 	def update_ring(self, transaction):
-		# update ring balance and utxos
-		for node in self.ring:
-			if node['public_key'] == transaction.sender_address:
-				node['balance'] -= transaction.amount
+		# update ring balance and utxos, and keep the spent outputs to be able to revert the transaction
+		spent = []
+		for input in transaction.transaction_inputs:
+			output = self.ring.utxos.spend(input.id)
+			# check_inputs, or the blocks before this one, made sure every input is unspent
+			assert output is not None, f'input {input.id} of {transaction.transaction_id} is not unspent'
+			spent.append(output)
+			self.spent_by[output.id] = transaction.transaction_id
+		self.undo[transaction.transaction_id] = spent
+		if self.ring.find(transaction.sender_address) is not None:
+			self.ring.utxos.add(transaction.transaction_outputs[0])
+		if self.ring.find(transaction.receiver_address) is not None:
+			self.ring.utxos.add(transaction.transaction_outputs[1])
 
-				spent_utxos = set([t['id'] for t in transaction.transaction_inputs])
-				current_utxos = set([t['id'] for t in node['utxos']])
-				node['utxos'] = [t for t in node['utxos'] if t['id'] in (current_utxos - spent_utxos)]
+	def revert_transaction(self, transaction):
+		# undoes update_ring and update_wallet for a transaction that left the mempool without being confirmed
+		# pending transactions that spend its outputs are reverted first
+		for output in transaction.transaction_outputs:
+			spender = self.spent_by.get(output.id)
+			if spender is not None and spender in self.mempool:
+				for dependent in self.mempool.remove([spender]):
+					self.revert_transaction(dependent)
+		for output in transaction.transaction_outputs:
+			self.ring.utxos.spend(output.id)
+			self.wallet.UTXOs.spend(output.id)
+		for output in self.undo.pop(transaction.transaction_id, []):
+			self.spent_by.pop(output.id, None)
+			self.ring.utxos.add(output)
+			if output.recipient == self.wallet.key_id:
+				self.wallet.UTXOs.add(output)
+		self.metrics.counter('transactions_reverted').inc()
 
-				node['utxos'].append(transaction.transaction_outputs[0])
-			elif node['public_key'] == transaction.receiver_address:
-				node['balance'] += transaction.amount
-				node['utxos'].append(transaction.transaction_outputs[1])
+	def revert_conflicts(self, transaction):
+		# reverts the pending transactions that spent the same outputs as a confirmed transaction
+		for input in transaction.transaction_inputs:
+			spender = self.spent_by.get(input.id)
+			if spender is not None and spender != transaction.transaction_id and spender in self.mempool:
+				for conflict in self.mempool.remove([spender]):
+					self.revert_transaction(conflict)
+
+	def forget_undo(self, block):
+		# drops the undo records of a block that is too deep to be abandoned
+		for transaction in block.transactions:
+			for output in self.undo.pop(transaction.transaction_id, []):
+				self.spent_by.pop(output.id, None)
 
 	def validate_transaction(self, transaction):
 		# validates incoming transaction
-		if not transaction.verify_signature():
-			return False
+		with self.metrics.histogram('transaction_validation_seconds').time():
+			valid = self.check_transaction(transaction)
+		self.metrics.counter('transactions_valid' if valid else 'transactions_invalid').inc()
+		return valid
 
-		for node in self.ring:
-			if node['public_key'] == transaction.sender_address:
-				if node['balance'] >= transaction.amount:
-					return True
+	def check_transaction(self, transaction):
+		with self.metrics.histogram('signature_verification_seconds').time():
+			if not self.verifier.verify(transaction):
+				return False
+
+		if self.ring.find(transaction.sender_address) is None or transaction.amount <= 0:
+			return False
+		return self.check_inputs(transaction)
 
-		return False
+	def check_inputs(self, transaction):
+		# every input must be a distinct unspent output of the sender with the declared value, and together they must cover the amount
+		# a transaction whose parent has not arrived yet is rejected, the sender's queue delivers the parent first
+		owner = fingerprint(transaction.sender_address)
+		ids = [input.id for input in transaction.transaction_inputs]
+		if len(set(ids)) != len(ids):
+			return False
+		total = 0
+		for input in transaction.transaction_inputs:
+			output = self.ring.utxos.get(input.id)
+			if output is None or output.recipient != owner or output.value != input.value:
+				return False
+			total += input.value
+		return total >= transaction.amount
 
-	def broadcast(self, url, obj, requests_function=requests.post):
-		def make_request(url):
-			if requests_function == requests.post:
-				return poll_endpoint(url, request_type='post', data=obj)
-			else:
-				return poll_endpoint(url, request_type='get', data=obj)
+	def verify_batch(self, transactions):
+		# verifies the signatures of many transactions at once, returns a list of booleans
+		with self.metrics.histogram('signature_batch_seconds').time():
+			results = self.verifier.verify_batch(transactions)
+		self.metrics.counter('signatures_verified_in_batches').inc(len(transactions))
+		return results
 
-		url_list = [
-            f"http://{node['ip']}:{node['port']}{url}" for node in self.ring
-            if node['public_key'] != self.wallet.public_key
+	def peer_addresses(self):
+		# returns the addresses of every other node in the ring
+		return [
+            node.address() for node in self.ring
+            if node.public_key != self.wallet.public_key
         ]
 
-		with concurrent.futures.ThreadPoolExecutor() as executor:
-			responses = [executor.submit(make_request, url) for url in url_list]
-			concurrent.futures.wait(responses)
+	def broadcast(self, url, obj=None, method='post'):
+		# sends a request to every other node and waits for their responses
+		with self.metrics.histogram('broadcast_seconds').time():
+			return self.transport.broadcast(self.peer_addresses(), url, obj, method)
 
-		return [r.result() for r in responses]
+	def gossip(self, url, obj):
+		# queues a request to every other node without waiting
+		self.transport.send(self.peer_addresses(), url, obj)
 
 	def mining_handler(self):
-		# mines block, broadcasts it if node wins the competition and adds it to the chain if it's valid
+		# waits for enough pending transactions, mines block, broadcasts it if node wins the competition and adds it to the chain if it's valid
+		# block_lock is held only to build the block and to connect it, not while searching for the nonce
 		while True:
-			if self.pause_thread.is_set():
+			idle_start = time.time()
+			with self.miner_wakeup:
+				self.miner_wakeup.wait_for(self.ready_to_mine)
+			mining_start = time.time()
+			self.idle_time += mining_start - idle_start
+			block_to_mine = self.prepare_block()
+			if block_to_mine is None:
 				continue
-			self.block_lock.acquire()
-			if len(self.pending_transactions) >= config.BLOCK_CAPACITY:
-				transactions = [self.pending_transactions.pop() for _ in range(config.BLOCK_CAPACITY)]
-				block_to_mine = Block(len(self.chain.blocks), transactions, self.chain.blocks[-1].current_hash)
-				if self.mine_block(block_to_mine):
-					self.write_mine_time()
-					print('+--------------+')
-					print('| Block mined! |')
-					print('+--------------+')
-					# add block to chain if valid
-					if self.chain.add_block(block_to_mine):
-						self.write_block_time()
-						# broadcast block
-						block_pickled = pickle.dumps(block_to_mine)
-						Thread(target=self.broadcast, args=('/register_block', deepcopy(block_pickled))).start()
-					else:
-						self.pending_transactions.extend(transactions)
-				else:
-					self.pending_transactions.extend(transactions)
-			self.block_lock.release()
+			if self.mine_block(block_to_mine):
+				print('+--------------+')
+				print('| Block mined! |')
+				print('+--------------+')
+				print(f'Hash rate: {self.miner.hash_rate:.0f} H/s')
+				self.block_mined(block_to_mine)
+			self.mining_time += time.time() - mining_start
+
+	def prepare_block(self):
+		# builds a block of pending transactions on the tip, or returns None if there are not enough of them
+		with self.block_lock:
+			if len(self.mempool) < config.BLOCK_CAPACITY:
+				return None
+			# transactions leave the mempool only when their block is added to the chain
+			transactions = self.mempool.peek(config.BLOCK_CAPACITY)
+			block = Block(len(self.chain.blocks), transactions, self.chain.blocks[-1].current_hash, self.clock())
+			# a new tip from now on makes this block stale
+			self.interrupt.clear()
+		return block
+
+	def block_mined(self, block):
+		# adds a block this node mined to the chain and broadcasts it if it is still the tip, returns the status of connect_block
+		self.metrics.counter('blocks_mined').inc()
+		with self.block_lock:
+			status = self.connect_block(block)
+		if status == EXTENDED:
+			self.gossip('/register_block', wire.encode_block(block))
+		return status
+
+	def ready_to_mine(self):
+		# checks if the miner should start a new block
+		return len(self.mempool) >= config.BLOCK_CAPACITY
+
+	def notify_miner(self):
+		# wakes the miner up to check if it can start a new block
+		with self.miner_wakeup:
+			self.miner_wakeup.notify()
+
+	def miner_stats(self):
+		# returns the seconds the miner spent waiting and mining, and the fraction of time it was busy
+		total = self.idle_time + self.mining_time
+		return {
+			'idle_time': self.idle_time,
+			'mining_time': self.mining_time,
+			'utilization': self.mining_time / total if total > 0 else 0
+		}
 
 	def mine_block(self, block):
-		# mines the given block
-		while not block.current_hash.startswith('0' * config.MINING_DIFFICULTY):
-			if self.pause_thread.is_set():
-				print('+-----------------+')
-				print('| Stopped mining! |')
-				print('+-----------------+')
-				return False
-			block.nonce += 1
-			block.current_hash = block.calc_hash()
+		# mines the given block with the configured mining engine
+		if block.current_hash.startswith('0' * config.MINING_DIFFICULTY):
+			return True
+		hashes = self.miner.total_hashes
+		with self.metrics.histogram('mining_seconds').time():
+			mined = self.miner.mine(block, config.MINING_DIFFICULTY, self.interrupt)
+		self.metrics.counter('mining_attempts').inc(self.miner.total_hashes - hashes)
+		if not mined:
+			self.metrics.counter('mining_aborted').inc()
+			print('+-----------------+')
+			print('| Stopped mining! |')
+			print('+-----------------+')
+			return False
 		return True
 
 	def resolve_conflicts(self):
-		# resolves conflict by selecting the longest valid chain
-		responses = self.broadcast('/send_chain_and_id', None, requests_function=requests.get)
-		responses = [pickle.loads(r._content) for r in responses]
-
-		max_chain_length = len(self.chain.blocks)
-		max_chain = self.chain
-		max_node_id = self.id
-		for response in responses:
-			if response[0].validate_chain():
-				if len(response[0].blocks) > max_chain_length:
-					max_chain_length = len(response[0].blocks)
-					max_chain = response[0]
-					max_node_id = response[1]
-
-		if max_node_id != self.id:
-			self.write_block_time()
-			# get ring from node with the longest valid chain
-			for node in self.ring:
-				if node['id'] == max_node_id:
-					ip = node['ip']
-					port = node['port']
-
-			response = poll_endpoint('http://' + ip + ':' + port + '/send_ring_and_pending_transactions', request_type='get')
-			(ring, pending_transactons) = pickle.loads(response._content)
-
-			self.pending_transactions = pending_transactons
-			self.chain = max_chain
-			self.ring = ring
-			for node in self.ring:
-				if node['id'] == self.id:
-					self.wallet.UTXOs = deepcopy(node['utxos'])
-
-	def write_block_time(self):
-		self.block_time_lock.acquire()
-		folder = f'{config.NUMBER_OF_NODES}-{config.MINING_DIFFICULTY}-{config.BLOCK_CAPACITY}'
-		target = f'block_time-{config.PORT}-{config.NUMBER_OF_NODES}-{config.MINING_DIFFICULTY}-{config.BLOCK_CAPACITY}.txt'
-		# with open('../../logs/' + folder + '/' + target, 'a') as file:
-		# 	file.write(str(time.time()) + '\n')
-		self.block_time_lock.release()
-
-	def write_mine_time(self):
-		folder = f'{config.NUMBER_OF_NODES}-{config.MINING_DIFFICULTY}-{config.BLOCK_CAPACITY}'
-		target = f'mine-{config.PORT}-{config.NUMBER_OF_NODES}-{config.MINING_DIFFICULTY}-{config.BLOCK_CAPACITY}.txt'
-		# with open('../../logs/' + folder + '/' + target, 'a') as file:
-		# 	file.write(str(time.time()) + '\n')
-
-	def write_validated_transactions(self):
-		self.validated_transactions_lock.acquire()
-		folder = f'{config.NUMBER_OF_NODES}-{config.MINING_DIFFICULTY}-{config.BLOCK_CAPACITY}'
-		target = f'validated_transactions-{config.PORT}-{config.NUMBER_OF_NODES}-{config.MINING_DIFFICULTY}-{config.BLOCK_CAPACITY}.txt'
-		# with open('../../logs/' + folder + '/' + target, 'a') as file:
-		# 	file.write(str(1) + '\n')
-		self.validated_transactions_lock.release()
\ No newline at end of file
+		# resolves conflict by syncing with the peer that has the longest chain
+		with self.metrics.histogram('resolve_conflicts_seconds').time():
+			self.metrics.counter('resolve_conflicts').inc()
+			self.sync_with_longest()
+
+	def sync_with_longest(self):
+		responses = self.broadcast('/send_chain_tip', method='get')
+		tips = []
+		for r in responses:
+			# peers without a chain answer 503, peers that send a malformed tip are skipped
+			if r.status_code != 200:
+				continue
+			try:
+				tips.append(wire.decode_tip(r.content))
+			except wire.WireError:
+				continue
+
+		# try the peers from the longest chain to the shortest, until one of them can be synced with
+		for (node_id, height, _) in sorted(tips, key=lambda tip: tip[1], reverse=True):
+			if height <= len(self.chain.blocks) - 1:
+				break
+			try:
+				if self.sync_with(node_id):
+					self.metrics.counter('syncs').inc()
+					return
+			except (requests.RequestException, wire.WireError):
+				# try the next peer if this one is unreachable or sends invalid data
+				continue
+
+	def sync_with(self, node_id):
+		# downloads only the blocks after the common ancestor with the given node and connects them like gossiped blocks
+		# the downloads and the transaction checks run without locks, block_lock is taken only to connect the blocks
+		address = self.ring.get(node_id).address()
+
+		response = self.transport.request(address, '/find_common_ancestor', wire.encode_locator(self.chain.locator()))
+		fork_height = wire.decode_height(response.content)
+		if fork_height is None:
+			return False
+
+		response = self.transport.request(address, '/send_blocks?start=' + str(fork_height + 1), method='get')
+		blocks = wire.decode_blocks(response.content, self.ring)
+		if len(blocks) == 0:
+			return False
+		# transactions are checked in parallel (pending ones are already verified), links and proofs of work in order
+		with self.metrics.histogram('chain_validation_seconds').time():
+			if not self.chain.validate_transactions(blocks, self.verifier):
+				return False
+
+		with self.block_lock:
+			if fork_height + len(blocks) <= len(self.chain.blocks) - 1:
+				return False
+			if not self.chain.validate_headers(self.chain.blocks[fork_height], blocks):
+				return False
+			# the ledger is rolled back to the fork point and the new blocks are applied, no state is copied from the peer
+			for block in blocks:
+				self.connect_block(block)
+			if self.chain.on_chain(blocks[-1].index, blocks[-1].current_hash):
+				self.chain.add_checkpoint(blocks[-1].index)
+		return True
+
+	def connect_block(self, block):
+		# adds a block to the block tree and updates the ledger if the chain changed, returns the status of Blockchain.receive (caller holds block_lock)
+		(status, abandoned, connected) = self.chain.receive(block)
+		if status == EXTENDED or status == REORGANIZED:
+			# the miner restarts on the new tip
+			self.interrupt.set()
+			self.publish_chain()
+			with self.node_lock:
+				self.reorganize(abandoned, connected)
+				self.publish_ledger()
+			if status == REORGANIZED:
+				self.metrics.counter('reorganizations').inc()
+				self.metrics.histogram('reorganization_depth', (1, 2, 3, 5, 10, 100)).observe(len(abandoned))
+		self.metrics.counter('blocks_' + status).inc()
+		return status
+
+	def reorganize(self, abandoned, connected):
+		# updates the ledger when the blocks of abandoned left the chain and the blocks of connected joined it
+		# the transactions of abandoned blocks stay applied to the ring, they are pending again from the time their block was mined
+		# they do not evict pending transactions, whose reverts could orphan abandoned transactions that are not re-added yet
+		# a transaction that does not fit is reverted together with the abandoned transactions that spend its outputs
+		failed = []
+		failed_ids = set()
+		for block in abandoned:
+			for transaction in block.transactions:
+				parents = set(output.transaction_id for output in self.undo.get(transaction.transaction_id, []))
+				if len(parents & failed_ids) > 0 or not self.mempool.add(transaction, transaction.amount, block.timestamp, evict=False):
+					failed.append(transaction)
+					failed_ids.add(transaction.transaction_id)
+		# dependents are reverted before the transactions whose outputs they spend
+		for transaction in reversed(failed):
+			self.revert_transaction(transaction)
+		for block in connected:
+			self.apply_block(block)
+			self.block_accepted(block)
+			# blocks deeper than UNDO_DEPTH below this one are not expected to be abandoned
+			height = block.index - config.UNDO_DEPTH
+			if height > 0:
+				self.forget_undo(self.chain.blocks[height])
+		# the snapshot is taken once every connected block is applied, the previous one may be ahead of the fork point
+		if len(abandoned) > 0 or any(block.index % config.SNAPSHOT_INTERVAL == 0 for block in connected):
+			self.save_snapshot()
+
+	def apply_block(self, block):
+		# updates the mempool, wallet and ring with a block that was added to the chain
+		pending = self.mempool.remove([t.transaction_id for t in block.transactions])
+		pending = set([t.transaction_id for t in pending])
+		# transactions that were not pending have not been applied yet, pending ones that conflict with them are reverted
+		for transaction in block.transactions:
+			if transaction.transaction_id not in pending:
+				self.revert_conflicts(transaction)
+				# update wallet UTXOs
+				self.update_wallet(transaction)
+				# update ring balance and utxos
+				self.update_ring(transaction)
+
+	def save_snapshot(self):
+		# saves the ledger state at the current height of the chain
+		if self.store is None:
+			return
+		self.store.save_snapshot({
+			'height': len(self.chain.blocks) - 1,
+			'id': self.id,
+			'wallet': self.wallet,
+			'ring': self.ring,
+			'mempool': self.mempool.transactions(),
+			'undo': self.undo,
+			'spent_by': self.spent_by,
+			'transaction_index': self.chain.transaction_index,
+			'address_index': self.chain.address_index,
+			'checkpoints': self.chain.checkpoints
+		})
+
+	def restore(self):
+		# loads the latest snapshot and applies the stored blocks after it, returns False if there is none
+		if self.store is None:
+			return False
+		snapshot = self.store.load_snapshot()
+		if snapshot is None:
+			self.chain.reset([])
+			return False
+		self.id = snapshot['id']
+		self.wallet = snapshot['wallet']
+		self.ring = snapshot['ring']
+		self.undo = snapshot.get('undo', {})
+		self.spent_by = snapshot.get('spent_by', {})
+		for transaction in snapshot['mempool']:
+			self.mempool.add(transaction, transaction.amount)
+		self.chain.transaction_index = snapshot['transaction_index']
+		self.chain.address_index = snapshot.get('address_index', {})
+		self.chain.checkpoints = snapshot.get('checkpoints', {})
+		for block in self.chain.blocks[snapshot['height'] + 1:]:
+			self.chain.index_block(block)
+			self.apply_block(block)
+		self.publish_chain()
+		self.publish_ledger()
+		return True
+
+	def request_sync(self):
+		# asks the sync thread to resolve conflicts with the other nodes, requests made during a sync are merged into the next one
+		self.sync_needed.set()
+
+	def sync_handler(self):
+		# resolves conflicts off the request threads, so that no endpoint waits for the downloads
+		while True:
+			self.sync_needed.wait()
+			self.sync_needed.clear()
+			try:
+				self.resolve_conflicts()
+			except Exception as error:
+				# a failed sync must not stop the thread, the next request retries it
+				self.metrics.counter('sync_errors').inc()
+				print(f'Sync failed: {error!r}')
+
+	def block_accepted(self, block):
+		# counts a block added to the chain and the seconds since the previous one
+		now = self.clock()
+		last = self.metrics.gauge('last_block_time')
+		if last.value:
+			self.metrics.histogram('block_interval_seconds').observe(now - last.value)
+		last.set(now)
+		self.metrics.counter('blocks_accepted').inc()
+		self.metrics.counter('transactions_confirmed').inc(len(block.transactions))
\ No newline at end of file
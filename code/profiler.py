@@ -0,0 +1,77 @@
+from threading import Thread, Event, Lock, get_ident
+import collections
+import sys
+import os
+
+# seconds between two samples of the stacks
+SAMPLE_INTERVAL = 0.01
+# frames kept from the top of every stack
+MAX_DEPTH = 20
+
+def frame_name(frame):
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}'
+
+class Profiler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        # samples the stacks of every thread of the process while it is running
+        self.interval = interval
+        self.lock = Lock()
+        self.stacks = collections.Counter()
+        self.functions = collections.Counter()
+        self.samples = 0
+        self.stopped = Event()
+        self.thread = None
+
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        # starts sampling and clears the previous samples
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.stacks.clear()
+            self.functions.clear()
+            self.samples = 0
+            self.stopped.clear()
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+        if thread is not None:
+            self.stopped.set()
+            thread.join()
+
+    def run(self):
+        me = get_ident()
+        while not self.stopped.wait(self.interval):
+            samples = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                samples.append(stack)
+            # threads that wait on a lock or a socket are sampled too, they show where time is lost
+            with self.lock:
+                for stack in samples:
+                    self.stacks[';'.join(reversed(stack))] += 1
+                    self.functions[stack[0]] += 1
+                self.samples += 1
+
+    def report(self, top=20):
+        # returns the most sampled stacks (outermost frame first) and innermost functions
+        with self.lock:
+            return {
+                'running': self.thread is not None,
+                'samples': self.samples,
+                'interval': self.interval,
+                'functions': self.functions.most_common(top),
+                'stacks': self.stacks.most_common(top)
+            }
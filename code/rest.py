@@ -4,9 +4,11 @@ from copy import deepcopy
 from flask import Flask
 from block import Block
 from node import Node
+from keys import KEY_TYPES
 import requests
 import config
 import socket
+import os
 
 BOOTSTRAP_IP = config.BOOTSTRAP_IP
 BOOTSTRAP_PORT = config.BOOTSTRAP_PORT
@@ -41,6 +43,35 @@ if __name__ == "__main__":
                         type=int,
                         help='The transaction capacity of a block.',
                         required=True)
+    parser.add_argument('-e',
+                        '--engine',
+                        choices=['serial', 'process'],
+                        default=config.MINING_ENGINE,
+                        help='The proof-of-work engine used for mining.')
+    parser.add_argument('-w',
+                        '--workers',
+                        type=int,
+                        default=config.MINING_WORKERS,
+                        help='The number of mining processes (defaults to the number of cores).')
+    parser.add_argument('--batch',
+                        action='store_true',
+                        help='Send new transactions to the other nodes in batches.')
+    parser.add_argument('-s',
+                        '--server',
+                        choices=['flask', 'asyncio'],
+                        default=config.SERVER,
+                        help='The HTTP server of the node.')
+    parser.add_argument('--data',
+                        default=config.DATA_DIR,
+                        help='The directory of the block store, a node with a snapshot there restarts from it.')
+    parser.add_argument('-k',
+                        '--key',
+                        default=config.KEY_FILE,
+                        help='The private key file of the wallet, created if it does not exist (defaults to wallet.pem in the data directory).')
+    parser.add_argument('--key-type',
+                        choices=KEY_TYPES,
+                        default=config.KEY_TYPE,
+                        help='The signature scheme of a new wallet key.')
     parser.add_argument('-b',
                         '--bootstrap',
                         action='store_true',
@@ -52,24 +83,52 @@ if __name__ == "__main__":
     config.MINING_DIFFICULTY = args.difficulty
     config.NUMBER_OF_NODES = args.nodes
     config.BLOCK_CAPACITY = args.capacity
+    config.MINING_ENGINE = args.engine
+    config.MINING_WORKERS = args.workers
+    config.DATA_DIR = args.data
+    config.BATCH_BROADCAST = args.batch
+    config.SERVER = args.server
+    config.KEY_TYPE = args.key_type
+    config.KEY_FILE = args.key if args.key is not None or args.data is None else os.path.join(args.data, 'wallet.pem')
     is_bootstrap = args.bootstrap
 
-    from endpoints import node, rest_api
+    import endpoints
+    from endpoints import rest_api
+    # in asyncio mode the requests to the other nodes run on the event loop of the server
+    transport = None
+    if config.SERVER == 'asyncio':
+        from async_transport import AsyncPeerTransport
+        transport = AsyncPeerTransport()
+    node = endpoints.node = Node(transport=transport)
 
     # Define the flask environment and register the blueprint with the endpoints.
     app = Flask(__name__)
     app.register_blueprint(rest_api)
 
-    if is_bootstrap:
+    def serve(host, port):
+        # listens in the given address (ip:port) with the selected server
+        if config.SERVER == 'asyncio':
+            import async_server
+            async_server.run(node, host, port)
+        else:
+            app.run(host=host, port=port)
+
+    if node.restore():
+        # restart with the stored identity, ledger state and chain, and fetch the blocks we missed
+        print('Node restored.')
+        account = node.ring.get(node.id)
+        node.request_sync()
+        serve(account.ip, account.port)
+    elif is_bootstrap:
         node.id = 0
         # create the genesis block
         # add the first transaction to it
         # add it to the chain
         node.create_genesis_block()
         # register bootstrap node in the ring
-        node.register_node_to_ring(0, BOOTSTRAP_IP, BOOTSTRAP_PORT, node.wallet.public_key, node.wallet.wallet_balance(), deepcopy(node.wallet.UTXOs))
+        node.register_node_to_ring(0, BOOTSTRAP_IP, BOOTSTRAP_PORT, node.wallet.public_key, deepcopy(list(node.wallet.UTXOs)))
         # listen in the specified address (ip:port)
-        app.run(host=BOOTSTRAP_IP, port=BOOTSTRAP_PORT)
+        serve(BOOTSTRAP_IP, BOOTSTRAP_PORT)
     else:
         # call bootstrap to register node in the ring
         response = requests.post('http://' + BOOTSTRAP_IP + ':' + BOOTSTRAP_PORT + '/register_node',
@@ -83,4 +142,4 @@ if __name__ == "__main__":
         node.id = response.json()['id']
 
         # Listen in the specified address (ip:port)
-        app.run(host=IP_address, port=config.PORT)
\ No newline at end of file
+        serve(IP_address, config.PORT)
\ No newline at end of file
@@ -0,0 +1,78 @@
+from functools import lru_cache
+from utxo import UTXOSet
+import hashlib
+
+@lru_cache(maxsize=1024)
+def fingerprint(public_key):
+    # short identifier of a public key
+    return hashlib.sha256(public_key.encode('ISO-8859-1')).hexdigest()[:16]
+
+class Account:
+    __slots__ = ('id', 'ip', 'port', 'public_key', 'fingerprint')
+
+    def __init__(self, id, ip, port, public_key):
+        # account initialization
+        self.id = id
+        self.ip = ip
+        self.port = port
+        self.public_key = public_key
+        self.fingerprint = fingerprint(public_key)
+
+    def address(self):
+        # returns the url of the node that owns this account
+        return 'http://' + self.ip + ':' + str(self.port)
+
+class Ring:
+    def __init__(self, accounts=(), utxos=()):
+        # ring initialization, here we store id, address(ip:port) and public key for every node and the utxos of all of them
+        self.utxos = UTXOSet(utxos)
+        self.accounts = []
+        self.by_id = {}
+        self.by_key = {}
+        self.by_fingerprint = {}
+        for account in accounts:
+            self.insert(account)
+
+    def __getstate__(self):
+        # only the accounts and utxos are sent over the network, the indexes are rebuilt by the receiver
+        return (self.accounts, list(self.utxos))
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __iter__(self):
+        return iter(self.accounts)
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def add(self, id, ip, port, public_key, utxos=()):
+        # adds a new account to the ring along with its unspent outputs
+        account = Account(id, ip, port, public_key)
+        self.insert(account)
+        for output in utxos:
+            self.utxos.add(output)
+        return account
+
+    def insert(self, account):
+        # adds an existing account to the ring and its indexes
+        self.accounts.append(account)
+        self.by_id[account.id] = account
+        self.by_key[account.public_key] = account
+        self.by_fingerprint[account.fingerprint] = account
+
+    def get(self, id):
+        # returns the account of the node with the given id or None
+        return self.by_id.get(id)
+
+    def find(self, public_key):
+        # returns the account with the given public key or None
+        return self.by_key.get(public_key)
+
+    def find_fingerprint(self, key_fingerprint):
+        # returns the account with the given key fingerprint or None
+        return self.by_fingerprint.get(key_fingerprint)
+
+    def balance(self, public_key):
+        # returns the balance of the account with the given public key
+        return self.utxos.balance(fingerprint(public_key))
@@ -0,0 +1,406 @@
+from werkzeug.datastructures import MultiDict
+from urllib.parse import urlsplit, parse_qsl
+from endpoints import ROUTES, handle
+from argparse import ArgumentParser
+from keys import KeyPool, KEY_TYPES
+from verifier import Verifier
+from wallet import Wallet
+from copy import deepcopy
+from node import Node
+import itertools
+import requests
+import config
+import random
+import heapq
+import json
+import wire
+import time
+
+# a simulated node searches the nonce space at this many hashes/sec
+HASH_RATE = 100000
+# the difficulty of the proofs of work that are actually computed, the simulated time of mining follows the simulated difficulty
+PROOF_DIFFICULTY = 1
+# round trips of a sync (tips, common ancestor, blocks)
+SYNC_ROUND_TRIPS = 3
+# like the retries of transport.Peer, a lost request is sent again after RETRY_DELAY * 2 ** attempt seconds
+RETRIES = 5
+RETRY_DELAY = 0.5
+
+class Clock:
+    def __init__(self):
+        # simulated seconds since the start of the simulation
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Response:
+    def __init__(self, payload, status):
+        # the parts of a requests.Response the nodes read
+        self.status_code = status
+        self.content = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+class Network:
+    def __init__(self, seed, latency, jitter, loss, on_delivery):
+        # delivers requests between simulated nodes in simulated time, in the order they are due
+        self.on_delivery = on_delivery
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.clock = Clock()
+        self.events = []
+        self.sequence = itertools.count()
+        self.nodes = {}
+        self.links = {} # (sender, receiver) -> simulated time when the link is free for the next message
+        self.handlers = {(path, method): handler for (path, method, handler) in ROUTES}
+        self.delivered = 0
+        self.lost = 0
+
+    def delay(self):
+        # one-way latency of a message
+        return max(0.0, self.random.gauss(self.latency, self.jitter))
+
+    def attempts(self):
+        # returns the seconds spent on lost attempts before a request got through, or None if every retry was lost
+        waited = 0.0
+        for attempt in range(RETRIES + 1):
+            if self.random.random() >= self.loss:
+                return waited
+            self.lost += 1
+            waited += self.delay() + RETRY_DELAY * 2 ** attempt
+        return None
+
+    def schedule(self, delay, action, *args):
+        # runs action(*args) after delay simulated seconds, events due at the same time run in the order they were scheduled
+        heapq.heappush(self.events, (self.clock.now + delay, next(self.sequence), action, args))
+
+    def run(self, until):
+        # runs the events due before the given time, returns False if none are left
+        while self.events and self.events[0][0] <= until:
+            (self.clock.now, _, action, args) = heapq.heappop(self.events)
+            action(*args)
+        self.clock.now = max(self.clock.now, until)
+        return len(self.events) > 0
+
+    def call(self, address, path, data, method):
+        # runs the handler of a request on the node with the given address
+        url = urlsplit(path)
+        values = MultiDict(parse_qsl(url.query))
+        if isinstance(data, dict):
+            for (key, value) in data.items():
+                values.add(key, str(value))
+            data = b''
+        (payload, status) = handle(self.handlers[(url.path, method.upper())], self.nodes[address], data or b'', values)
+        return Response(payload, status)
+
+    def deliver(self, address, path, data):
+        self.delivered += 1
+        self.call(address, path, data, 'post')
+        self.on_delivery(self.nodes[address])
+
+class Transport:
+    def __init__(self, network, address):
+        # the transport of one simulated node, messages go through the shared network
+        self.network = network
+        self.address = address
+
+    def request(self, address, path, data=None, method='post'):
+        # requests made while handling an event are answered at once, their latency is charged to the event that made them
+        if self.network.attempts() is None:
+            raise requests.ConnectionError('Lost in the simulated network.')
+        return self.network.call(address, path, data, method)
+
+    def send(self, addresses, path, data):
+        # like the send queue of transport.Peer, the messages to a peer arrive one by one in the order they were sent
+        network = self.network
+        for address in addresses:
+            waited = network.attempts()
+            if waited is None:
+                continue
+            link = (self.address, address)
+            arrival = max(network.clock.now, network.links.get(link, 0.0)) + waited + network.delay()
+            network.links[link] = arrival
+            network.schedule(arrival - network.clock.now, network.deliver, address, path, data)
+
+    def broadcast(self, addresses, path, data=None, method='post'):
+        responses = []
+        for address in addresses:
+            try:
+                responses.append(self.request(address, path, data, method))
+            except requests.RequestException:
+                continue
+        return responses
+
+    def stats(self):
+        return {}
+
+class Simulation:
+    def __init__(self, nodes, difficulty, capacity, args):
+        # one network of simulated nodes running the real node, chain and consensus code
+        config.NUMBER_OF_NODES = nodes
+        config.MINING_DIFFICULTY = args.proof_difficulty
+        config.BLOCK_CAPACITY = capacity
+        config.MINING_ENGINE = 'serial'
+        config.VERIFIER_WORKERS = 1
+        config.DATA_DIR = None
+        config.BATCH_BROADCAST = False
+        self.difficulty = difficulty
+        self.args = args
+        self.network = Network(args.seed, args.latency, args.jitter, args.loss, self.update)
+        self.random = random.Random(args.seed + 1)
+        # every signature is verified once for the whole network, the simulated time does not depend on it
+        verifier = Verifier(1)
+        key_pool = KeyPool(args.key_pool, args.key_type) if args.key_pool else None
+        if key_pool is not None:
+            key_pool.fill(nodes)
+        self.nodes = []
+        for i in range(nodes):
+            wallet = Wallet(key_pool.path(i) if key_pool is not None else None, args.key_type)
+            self.nodes.append(Node(i, Transport(self.network, self.address(i)), verifier, self.network.clock, threads=False, wallet=wallet))
+        for node in self.nodes:
+            self.network.nodes[self.address(node.id)] = node
+        self.mining = {} # node id -> (block, simulated time when its nonce is found)
+        self.mined = {} # hash -> simulated time when the block was mined
+        self.syncing = set()
+        self.tips = {} # node id -> hash of its tip
+        self.tip_counts = {} # hash -> number of nodes whose tip it is
+        self.diverged_at = None
+        self.converged_at = None
+        self.divergences = [] # simulated seconds the nodes spent on different tips, every time they disagreed
+        self.submitted = {}
+        self.transactions = set()
+
+    def address(self, i):
+        return 'http://sim:' + str(i)
+
+    def bootstrap(self):
+        # the steps of rest.py and /register_node without HTTP, every node gets 100 coins from the bootstrap node
+        bootstrap = self.nodes[0]
+        bootstrap.create_genesis_block()
+        bootstrap.register_node_to_ring(0, 'sim', 0, bootstrap.wallet.public_key, deepcopy(list(bootstrap.wallet.UTXOs)))
+        for node in self.nodes[1:]:
+            bootstrap.register_node_to_ring(node.id, 'sim', node.id, node.wallet.public_key)
+        # the ring and chain are not lost, a node without them cannot take part
+        loss = self.network.loss
+        self.network.loss = 0
+        bootstrap.broadcast('/receive_ring_and_chain', obj=wire.encode_ring_and_chain(bootstrap.ring, bootstrap.chain.blocks))
+        self.network.loss = loss
+        for node in self.nodes[1:]:
+            bootstrap.create_transaction(node.wallet.public_key, 100)
+        for node in self.nodes:
+            self.update(node)
+
+    def update(self, node):
+        # drives the node after an event, like its mining and sync threads would
+        self.track_tip(node)
+        if node.sync_needed.is_set() and node.id not in self.syncing:
+            node.sync_needed.clear()
+            self.syncing.add(node.id)
+            self.network.schedule(2 * SYNC_ROUND_TRIPS * self.network.delay(), self.sync, node)
+        if node.id in self.mining and node.interrupt.is_set():
+            # the tip changed, the block being mined is stale
+            del self.mining[node.id]
+            node.metrics.counter('mining_aborted').inc()
+        if node.id not in self.mining and node.ready_to_mine():
+            block = node.prepare_block()
+            if block is not None:
+                # the number of attempts until a hash meets the difficulty is geometric, so the time is exponential
+                seconds = self.random.expovariate(self.args.hash_rate / 16 ** self.difficulty)
+                self.mining[node.id] = (block, self.network.clock.now + seconds)
+                self.network.schedule(seconds, self.found_nonce, node, block)
+
+    def found_nonce(self, node, block):
+        if self.mining.get(node.id, (None,))[0] is not block:
+            return
+        del self.mining[node.id]
+        if node.mine_block(block):
+            self.mined[block.current_hash] = self.network.clock.now
+            node.block_mined(block)
+        self.update(node)
+
+    def sync(self, node):
+        self.syncing.discard(node.id)
+        node.resolve_conflicts()
+        self.update(node)
+
+    def track_tip(self, node):
+        # counts the nodes on every tip, the network has converged when they are all on the same one
+        tip = node.chain_view.tip.current_hash if node.chain_view.tip is not None else None
+        previous = self.tips.get(node.id)
+        if tip == previous:
+            return
+        if previous is not None:
+            self.tip_counts[previous] -= 1
+            if self.tip_counts[previous] == 0:
+                del self.tip_counts[previous]
+        self.tips[node.id] = tip
+        self.tip_counts[tip] = self.tip_counts.get(tip, 0) + 1
+        if len(self.tips) < len(self.nodes):
+            return
+        if len(self.tip_counts) > 1 and self.diverged_at is None:
+            self.diverged_at = self.network.clock.now
+        elif len(self.tip_counts) == 1:
+            if self.diverged_at is not None:
+                self.divergences.append(self.network.clock.now - self.diverged_at)
+                self.diverged_at = None
+            self.converged_at = self.network.clock.now
+
+    def submit(self, node):
+        # a client sends a transaction to a random other node, then waits for the next one
+        if self.network.clock.now < self.load_end:
+            receiver_id = self.random.randrange(len(self.nodes) - 1)
+            receiver_id += receiver_id >= node.id
+            response = self.network.call(self.address(node.id), '/create_new_transaction', {'receiver_id': receiver_id, 'amount': 1}, 'post')
+            self.submitted[response.status_code] = self.submitted.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                self.transactions.add(response.json()['transaction_id'])
+            self.update(node)
+            self.network.schedule(self.random.expovariate(self.args.rate), self.submit, node)
+
+    def run(self):
+        # bootstraps the network, runs the load for the given simulated seconds and lets the nodes settle
+        start = time.time()
+        self.bootstrap()
+        self.network.run(self.args.warmup)
+        self.load_start = self.network.clock.now
+        self.load_end = self.load_start + self.args.duration
+        for node in self.nodes:
+            self.network.schedule(self.random.expovariate(self.args.rate), self.submit, node)
+        self.network.run(self.load_end + self.args.drain)
+        return self.results(time.time() - start)
+
+    def results(self, elapsed):
+        chains = {}
+        for node in self.nodes:
+            chains[node.chain_view.tip.current_hash] = node.chain_view
+        longest = max(chains.values(), key=lambda view: view.height)
+        blocks = longest.range(0)
+        # the load is confirmed at the time the last block with one of its transactions was mined
+        confirmed = 0
+        last_block = self.load_start
+        for block in blocks:
+            count = sum(1 for t in block.transactions if t.transaction_id in self.transactions)
+            if count > 0:
+                confirmed += count
+                last_block = max(last_block, self.mined.get(block.current_hash, last_block))
+        mined = len(self.mined)
+        on_chain = sum(1 for block in blocks if block.current_hash in self.mined)
+        balances = set(tuple(sorted(node.ledger_view.balances.items())) for node in self.nodes)
+        converged = len(self.tip_counts) == 1
+        settled = max(0.0, self.converged_at - self.load_end) if converged else None
+        return {
+            'nodes': len(self.nodes),
+            'difficulty': self.difficulty,
+            'capacity': config.BLOCK_CAPACITY,
+            'submitted': {str(status): count for (status, count) in sorted(self.submitted.items())},
+            'confirmed': confirmed,
+            'throughput': confirmed / (last_block - self.load_start) if last_block > self.load_start else 0,
+            'blocks_mined': mined,
+            'fork_rate': 1 - on_chain / mined if mined else 0,
+            'reorganizations': sum(node.metrics.counter('reorganizations').value for node in self.nodes),
+            'divergences': len(self.divergences),
+            'average_convergence_time': sum(self.divergences) / len(self.divergences) if self.divergences else 0,
+            'max_convergence_time': max(self.divergences, default=0),
+            'converged_after_load': settled,
+            'consistent_ledgers': len(balances) == 1,
+            'messages': self.network.delivered,
+            'lost': self.network.lost,
+            'simulated_seconds': self.network.clock.now,
+            'wall_seconds': elapsed
+        }
+
+def print_result(r):
+    settled = f'{r["converged_after_load"]:.2f}s after the load' if r['converged_after_load'] is not None else 'never'
+    print(f'nodes={r["nodes"]} difficulty={r["difficulty"]} capacity={r["capacity"]}: '
+          f'{r["throughput"]:.2f} tx/s, {r["confirmed"]} confirmed, fork rate {r["fork_rate"]:.1%}, '
+          f'{r["reorganizations"]} reorganizations, converged in {r["average_convergence_time"]:.2f}s on average and {settled}, '
+          f'ledgers {"consistent" if r["consistent_ledgers"] else "inconsistent"} '
+          f'({r["simulated_seconds"]:.0f} simulated seconds in {r["wall_seconds"]:.1f}s)')
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Simulate networks of noobcash nodes in one process, in simulated time.')
+    parser.add_argument('-n',
+                        '--nodes',
+                        type=int,
+                        nargs='+',
+                        help='The numbers of nodes to simulate.',
+                        required=True)
+    parser.add_argument('-d',
+                        '--difficulty',
+                        type=int,
+                        nargs='+',
+                        help='The mining difficulties to simulate.',
+                        required=True)
+    parser.add_argument('-c',
+                        '--capacity',
+                        type=int,
+                        nargs='+',
+                        help='The block capacities to simulate.',
+                        required=True)
+    parser.add_argument('-r',
+                        '--rate',
+                        type=float,
+                        default=0.2,
+                        help='Transactions/sec sent to every node.')
+    parser.add_argument('-t',
+                        '--duration',
+                        type=float,
+                        default=60,
+                        help='Simulated seconds of load.')
+    parser.add_argument('--warmup',
+                        type=float,
+                        default=10,
+                        help='Simulated seconds for the initial coins to spread before the load starts.')
+    parser.add_argument('--drain',
+                        type=float,
+                        default=30,
+                        help='Simulated seconds for the nodes to settle after the load.')
+    parser.add_argument('--latency',
+                        type=float,
+                        default=0.05,
+                        help='Average one-way latency (seconds) between two nodes.')
+    parser.add_argument('--jitter',
+                        type=float,
+                        default=0.01,
+                        help='Standard deviation (seconds) of the latency.')
+    parser.add_argument('--loss',
+                        type=float,
+                        default=0,
+                        help='The fraction of the messages that are lost.')
+    parser.add_argument('--hash-rate',
+                        type=float,
+                        default=HASH_RATE,
+                        help='Hashes/sec of every simulated miner.')
+    parser.add_argument('--proof-difficulty',
+                        type=int,
+                        default=PROOF_DIFFICULTY,
+                        help='The difficulty of the proofs of work that are computed, only the simulated time follows --difficulty.')
+    parser.add_argument('--key-type',
+                        choices=KEY_TYPES,
+                        default='rsa',
+                        help='The signature scheme of the wallets.')
+    parser.add_argument('--key-pool',
+                        default=None,
+                        help='A directory of pre-generated keys (see keys.py) to use instead of new keys.')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='The seed of the latencies, losses, mining times and transactions.')
+    parser.add_argument('-o',
+                        '--output',
+                        default=None,
+                        help='A JSON file for the results.')
+
+    args = parser.parse_args()
+    results = []
+    for (nodes, difficulty, capacity) in itertools.product(args.nodes, args.difficulty, args.capacity):
+        result = Simulation(nodes, difficulty, capacity, args).run()
+        print_result(result)
+        results.append(result)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=4)
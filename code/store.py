@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from threading import Lock
+import struct
+import pickle
+import mmap
+import os
+
+# number of decoded blocks kept in memory
+CACHE_SIZE = 256
+# format of the snapshot and the pickled blocks, older snapshots are ignored and the node starts over
+SNAPSHOT_VERSION = 2
+
+class BlockStore:
+    def __init__(self, directory):
+        # append-only block log, with a fixed-width index of the offset of every height and a state snapshot
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, 'snapshot.pkl')
+        self.log = open(os.path.join(directory, 'blocks.log'), 'ab+')
+        self.index = open(os.path.join(directory, 'blocks.idx'), 'ab+')
+        self.map = None
+
+    def __len__(self):
+        return os.fstat(self.index.fileno()).st_size // 8
+
+    def offset(self, height):
+        # returns the offset of a block in the log
+        return struct.unpack('<Q', os.pread(self.index.fileno(), 8, 8 * height))[0]
+
+    def append(self, block):
+        # appends a block to the log and its offset to the index
+        data = pickle.dumps(block)
+        offset = os.fstat(self.log.fileno()).st_size
+        self.log.write(struct.pack('<I', len(data)) + data)
+        self.log.flush()
+        self.index.write(struct.pack('<Q', offset))
+        self.index.flush()
+
+    def read(self, height):
+        # decodes the block at the given height straight from the memory-mapped log
+        offset = self.offset(height)
+        if self.map is None or offset + 4 > len(self.map):
+            self.remap()
+        (length,) = struct.unpack_from('<I', self.map, offset)
+        if offset + 4 + length > len(self.map):
+            self.remap()
+        return pickle.loads(memoryview(self.map)[offset + 4:offset + 4 + length])
+
+    def remap(self):
+        # maps the log again after it has grown
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.log.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def truncate(self, height):
+        # drops every block from the given height on
+        if height >= len(self):
+            return
+        offset = self.offset(height)
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.log.truncate(offset)
+        self.index.truncate(8 * height)
+
+    def save_snapshot(self, state):
+        # replaces the snapshot atomically, so a crash leaves either the old or the new one
+        path = self.snapshot_path + '.tmp'
+        # the wallet in the state holds the private key, so only the owner can read the snapshot
+        if os.path.exists(path):
+            os.remove(path)
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as file:
+            pickle.dump(SNAPSHOT_VERSION, file)
+            pickle.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path, self.snapshot_path)
+
+    def load_snapshot(self):
+        # returns the latest snapshot, or None if there is none or it has an older format
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, 'rb') as file:
+            # snapshots before SNAPSHOT_VERSION start with the state itself
+            if pickle.load(file) != SNAPSHOT_VERSION:
+                print('Ignoring a snapshot of an older format.')
+                return None
+            return pickle.load(file)
+
+class StoredBlocks:
+    def __init__(self, store):
+        # list-like view of the blocks of a BlockStore, blocks are decoded on access
+        self.store = store
+        self.length = len(store)
+        self.cache = OrderedDict()
+        # readers of the published chain view share the cache with the writer
+        self.lock = Lock()
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for height in range(self.length):
+            yield self[height]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[height] for height in range(*key.indices(self.length))]
+        if key < 0:
+            key += self.length
+        if key < 0 or key >= self.length:
+            raise IndexError('block height out of range')
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            return self.remember(key, self.store.read(key))
+
+    def __delitem__(self, key):
+        # only deleting a suffix of the chain is supported
+        start = key.indices(self.length)[0] if isinstance(key, slice) else key
+        with self.lock:
+            for height in [h for h in self.cache if h >= start]:
+                del self.cache[height]
+            self.store.truncate(start)
+            self.length = min(self.length, start)
+
+    def append(self, block):
+        with self.lock:
+            self.store.append(block)
+            self.remember(self.length, block)
+            self.length += 1
+
+    def remember(self, height, block):
+        self.cache[height] = block
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return block
@@ -1,68 +1,339 @@
+from keys import KeyPool, KEY_TYPES
 from argparse import ArgumentParser
-from threading import Thread
+from threading import Thread, Lock, Event
+import subprocess
+import statistics
 import requests
-import pickle
 import config
-import random
+import json
 import time
+import wire
+import sys
+import os
 
-LIMIT = None
-
-def thread_function(i, number_of_nodes, responses):
-    with open(f'../transactions/{number_of_nodes}nodes/transactions{i}.txt', 'r') as f:
-        count = 0
-        for line in f:
-            id, amount = line.split(' ')
-            id = int(id[2])
-            amount = int(amount)
-            response = requests.post('http://' + config.BOOTSTRAP_IP + ':500' + str(i) + '/create_new_transaction',
-                                    data=pickle.dumps((id, amount)))
-            responses.append(response)
-            count += 1
-            if LIMIT and count > LIMIT:
+RESULTS_DIR = '../results'
+
+def percentile(values, p):
+    # returns the p-th percentile of the values (nearest rank)
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def node_url(i):
+    return 'http://' + config.BOOTSTRAP_IP + ':' + str(int(config.BOOTSTRAP_PORT) + i)
+
+class Cluster:
+    def __init__(self, nodes, difficulty, capacity, node_args, log_dir, key_pool=None):
+        # a local cluster of nodes, one rest.py process per node, with the keys of the given pool if any
+        self.nodes = nodes
+        self.difficulty = difficulty
+        self.capacity = capacity
+        self.node_args = node_args
+        self.log_dir = log_dir
+        self.key_pool = key_pool
+        self.processes = []
+
+    def start(self, timeout=120):
+        # starts the bootstrap node and then the others, and waits until the initial coins are distributed
+        os.makedirs(self.log_dir, exist_ok=True)
+        if self.key_pool is not None:
+            self.key_pool.fill(self.nodes)
+        for i in range(self.nodes):
+            args = [sys.executable, 'rest.py', '-p', str(int(config.BOOTSTRAP_PORT) + i), '-n', str(self.nodes),
+                    '-d', str(self.difficulty), '-c', str(self.capacity)] + self.node_args
+            if self.key_pool is not None:
+                args += ['-k', self.key_pool.path(i), '--key-type', self.key_pool.key_type]
+            if i == 0:
+                args.append('-b')
+            log = open(os.path.join(self.log_dir, f'node{i}.log'), 'w')
+            self.processes.append(subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT))
+            self.wait_for(lambda: self.is_listening(i), timeout)
+        self.wait_for(lambda: all(self.balance(i) == 100 for i in range(self.nodes)), timeout)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+        self.processes = []
+
+    def wait_for(self, condition, timeout):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                self.stop()
+                raise TimeoutError('The cluster did not start in time.')
+            time.sleep(0.2)
+
+    def is_listening(self, i):
+        # non-bootstrap nodes start listening only after they have registered to the bootstrap node
+        try:
+            requests.get(node_url(i) + '/send_chain_tip', timeout=1)
+            return True
+        except requests.RequestException:
+            return False
+
+    def balance(self, i):
+        try:
+            return requests.get(node_url(i) + '/get_balance', timeout=1).json()['balance']
+        except (requests.RequestException, ValueError, KeyError):
+            return None
+
+class ChainObserver:
+    def __init__(self, nodes, interval):
+        # polls the tips of every node and the chain of the bootstrap node while the benchmark runs
+        self.nodes = nodes
+        self.interval = interval
+        self.ring = None
+        self.tips = {}
+        self.first_seen = {}
+        self.height = 0
+        self.stopped = Event()
+        self.thread = Thread(target=self.run)
+
+    def start(self):
+        response = requests.get(node_url(0) + '/send_ring_and_pending_transactions')
+        (self.ring, _) = wire.decode_ring_and_transactions(response.content)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        now = time.time()
+        for i in range(self.nodes):
+            try:
+                (_, height, tip_hash) = wire.decode_tip(requests.get(node_url(i) + '/send_chain_tip', timeout=5).content)
+                self.tips.setdefault(height, set()).add(tip_hash)
+            except (requests.RequestException, wire.WireError):
+                continue
+        # download the new blocks of the bootstrap node, with some overlap in case its tip was replaced
+        try:
+            start = max(0, self.height - 10)
+            response = requests.get(node_url(0) + '/send_blocks?start=' + str(start), timeout=10)
+            blocks = wire.decode_blocks(response.content, self.ring)
+        except (requests.RequestException, wire.WireError):
+            return
+        for block in blocks:
+            for transaction in block.transactions:
+                self.first_seen.setdefault(transaction.transaction_id, now)
+        self.height = start + len(blocks)
+
+    def final_chain(self):
+        response = requests.get(node_url(0) + '/send_chain')
+        return wire.decode_blocks(response.content, self.ring)
+
+    def forks(self):
+        # every extra tip observed at some height was a competing block
+        return sum(len(hashes) - 1 for hashes in self.tips.values())
+
+class Client:
+    def __init__(self, i, nodes, rate, mode, limit):
+        # replays transactions{i}.txt against node i
+        self.i = i
+        self.rate = rate
+        self.mode = mode
+        self.session = requests.Session()
+        self.lock = Lock()
+        self.submitted = {}
+        self.statuses = {}
+        self.latencies = []
+        self.threads = []
+        with open(f'../transactions/{nodes}nodes/transactions{i}.txt', 'r') as f:
+            self.transactions = []
+            for line in f:
+                id, amount = line.split(' ')
+                self.transactions.append((int(id[2]), int(amount)))
+        if limit:
+            self.transactions = self.transactions[:limit]
+
+    def submit(self, receiver_id, amount):
+        start = time.time()
+        try:
+            response = self.session.post(node_url(self.i) + '/create_new_transaction',
+                                         data={'receiver_id': receiver_id, 'amount': amount})
+            status = response.status_code
+        except requests.RequestException:
+            status = 'error'
+        with self.lock:
+            self.latencies.append(time.time() - start)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status == 200:
+                self.submitted[response.json()['transaction_id']] = start
+
+    def run(self):
+        if self.mode == 'closed':
+            # the next transaction is sent once the previous one is answered, after 1 / rate seconds of think time
+            for (receiver_id, amount) in self.transactions:
+                self.submit(receiver_id, amount)
+                if self.rate:
+                    time.sleep(1 / self.rate)
+        else:
+            # transactions are sent on a fixed schedule, whether or not the previous ones were answered
+            start = time.time()
+            for k, (receiver_id, amount) in enumerate(self.transactions):
+                time.sleep(max(0, start + k / self.rate - time.time()))
+                thread = Thread(target=self.submit, args=(receiver_id, amount))
+                thread.start()
+                self.threads.append(thread)
+            for thread in self.threads:
+                thread.join()
+
+def run_point(nodes, difficulty, capacity, args):
+    # runs the benchmark for one (nodes, difficulty, capacity) point and returns its results
+    label = f'{nodes}-{difficulty}-{capacity}'
+    key_pool = KeyPool(key_type=args.keys) if args.keys else None
+    cluster = Cluster(nodes, difficulty, capacity, args.node_args, os.path.join(args.output, 'logs', label), key_pool)
+    cluster.start()
+    try:
+        observer = ChainObserver(nodes, args.poll)
+        observer.start()
+        clients = [Client(i, nodes, args.rate / nodes if args.rate else None, args.mode, args.limit) for i in range(nodes)]
+        threads = [Thread(target=client.run) for client in clients]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        load_time = time.time() - start
+
+        submitted = {}
+        for client in clients:
+            submitted.update(client.submitted)
+        # wait until every accepted transaction is confirmed, or until no new ones are confirmed for a while
+        # (the last transactions stay pending if they do not fill a block)
+        confirmed = 0
+        last_progress = time.time()
+        while time.time() - last_progress < args.drain:
+            time.sleep(args.poll)
+            now_confirmed = len([t for t in submitted if t in observer.first_seen])
+            if now_confirmed == len(submitted):
                 break
-            time.sleep(random.random() * 10)
+            if now_confirmed > confirmed:
+                confirmed = now_confirmed
+                last_progress = time.time()
+        observer.stop()
+        chain = observer.final_chain()
+    finally:
+        cluster.stop()
+
+    final = set(t.transaction_id for block in chain for t in block.transactions)
+    latencies = [observer.first_seen[t] - submitted[t] for t in submitted if t in final and t in observer.first_seen]
+    last_confirmation = max([observer.first_seen[t] for t in submitted if t in final and t in observer.first_seen], default=start)
+    block_times = [chain[k].timestamp - chain[k - 1].timestamp for k in range(2, len(chain))]
+    statuses = {}
+    for client in clients:
+        for (status, count) in client.statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    request_latencies = [l for client in clients for l in client.latencies]
+    return {
+        'nodes': nodes,
+        'difficulty': difficulty,
+        'capacity': capacity,
+        'mode': args.mode,
+        'rate': args.rate,
+        'node_args': args.node_args,
+        'submitted': sum(statuses.values()),
+        'statuses': statuses,
+        'accepted': len(submitted),
+        'confirmed': len(latencies),
+        'load_time': load_time,
+        'throughput': len(latencies) / (last_confirmation - start) if last_confirmation > start else 0,
+        'blocks': len(chain),
+        'block_time': {
+            'mean': statistics.mean(block_times) if block_times else None,
+            'median': statistics.median(block_times) if block_times else None
+        },
+        'confirmation_latency': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies, default=None)
+        },
+        'request_latency': {
+            'p50': percentile(request_latencies, 50),
+            'p99': percentile(request_latencies, 99)
+        },
+        'forks': observer.forks()
+    }
 
 if __name__ == "__main__":
-    parser = ArgumentParser(description='Testing the noobcash system.')
+    parser = ArgumentParser(description='Benchmark the throughput and latency of a local noobcash cluster.')
     parser.add_argument('-n',
                         '--nodes',
                         type=int,
-                        help='The number of nodes in the blockchain.',
+                        nargs='+',
+                        help='The number of nodes in the blockchain (5 or 10).',
                         required=True)
     parser.add_argument('-d',
                         '--difficulty',
                         type=int,
+                        nargs='+',
                         help='The mining difficulty of a new block.',
                         required=True)
     parser.add_argument('-c',
                         '--capacity',
                         type=int,
+                        nargs='+',
                         help='The transaction capacity of a block.',
                         required=True)
+    parser.add_argument('-m',
+                        '--mode',
+                        choices=['open', 'closed'],
+                        default='closed',
+                        help='Open loop sends on a fixed schedule, closed loop waits for every response.')
+    parser.add_argument('-r',
+                        '--rate',
+                        type=float,
+                        default=None,
+                        help='Transactions/sec over the whole cluster (required in open loop, think time in closed loop).')
+    parser.add_argument('-l',
+                        '--limit',
+                        type=int,
+                        default=None,
+                        help='The number of transactions replayed from every file.')
+    parser.add_argument('--poll',
+                        type=float,
+                        default=0.5,
+                        help='Seconds between polls of the chain.')
+    parser.add_argument('--drain',
+                        type=float,
+                        default=30,
+                        help='Seconds to wait for new confirmations after the load ends.')
+    parser.add_argument('-o',
+                        '--output',
+                        default=RESULTS_DIR,
+                        help='The directory of the results.')
+    parser.add_argument('-k',
+                        '--keys',
+                        choices=KEY_TYPES,
+                        default=None,
+                        help='Start the nodes with keys of this type from the pre-generated pool, instead of new keys.')
+    parser.add_argument('node_args',
+                        nargs='*',
+                        help='Extra arguments passed to every node after --, e.g. -- -s asyncio --batch.')
 
     args = parser.parse_args()
-    number_of_nodes = args.nodes
-    difficulty = args.difficulty
-    capacity = args.capacity
-    if number_of_nodes != 5 and number_of_nodes != 10:
+    if any(n != 5 and n != 10 for n in args.nodes):
         print('Please use 5 or 10 nodes.')
         exit()
+    if args.mode == 'open' and not args.rate:
+        print('Please provide the rate of the open loop.')
+        exit()
 
-    threads = []
-    responses = []
-    for i in range(number_of_nodes):
-        thread = Thread(target=thread_function, args=(i, number_of_nodes, responses))
-        threads.append(thread)
-        thread.start()
-
-    folder = f'{number_of_nodes}-{difficulty}-{capacity}'
-    target = f'start_time-{number_of_nodes}-{difficulty}-{capacity}.txt'
-    with open('../../logs/' + folder + '/' + target, 'a') as file:
-        file.write(str(time.time()) + '\n')
-    print('Testing has started.')
-
-    for t in threads:
-        t.join()
-
-    print('Testing completed successfully.')
\ No newline at end of file
+    os.makedirs(args.output, exist_ok=True)
+    for nodes in args.nodes:
+        for difficulty in args.difficulty:
+            for capacity in args.capacity:
+                print(f'Benchmarking {nodes} nodes, difficulty {difficulty}, capacity {capacity}.')
+                results = run_point(nodes, difficulty, capacity, args)
+                with open(os.path.join(args.output, f'{nodes}-{difficulty}-{capacity}.json'), 'w') as file:
+                    json.dump(results, file, indent=4)
+                print(f'{results["throughput"]:.2f} transactions/sec, block time {results["block_time"]["mean"]}, '
+                      f'p50 confirmation latency {results["confirmation_latency"]["p50"]}, {results["forks"]} forks')
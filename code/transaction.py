@@ -1,10 +1,41 @@
-from Crypto.Signature import PKCS1_PSS
-from Crypto.PublicKey import RSA
 from Crypto.Hash import SHA256
+from ring import fingerprint
+import keys
 import json
-import uuid
+
+def output_id(transaction_id, index):
+    # the id of an output, derived from the first 120 bits of the id of its transaction and its index
+    return (int(transaction_id[:30], 16) << 8) | index
+
+class TxInput:
+    __slots__ = ('id', 'value')
+
+    def __init__(self, id, value):
+        # an output spent by a transaction
+        self.id = id
+        self.value = value
+
+    def __reduce__(self):
+        # pickled as a constructor call, without the names of the slots
+        return (TxInput, (self.id, self.value))
+
+class TxOutput:
+    __slots__ = ('id', 'transaction_id', 'recipient', 'value')
+
+    def __init__(self, id, transaction_id, recipient, value):
+        # coins of the recipient, which is the fingerprint of its public key
+        self.id = id
+        self.transaction_id = transaction_id
+        self.recipient = recipient
+        self.value = value
+
+    def __reduce__(self):
+        return (TxOutput, (self.id, self.transaction_id, self.recipient, self.value))
 
 class Transaction:
+    __slots__ = ('sender_address', 'receiver_address', 'amount', 'transaction_inputs', 'transaction_id',
+                 'transaction_outputs', 'signature')
+
     def __init__(self, sender_address, receiver_address, amount, transaction_inputs, private_key):
         # transaction initialization
         self.sender_address = sender_address
@@ -16,23 +47,13 @@ class Transaction:
         self.signature = self.sign_transaction(private_key)
 
     def sign_transaction(self, private_key):
-        # signs the transaction using the sender's private key
+        # signs the transaction using the sender's private key, with the scheme of the key
         message = self.transaction_id.encode("ISO-8859-1")
-        key = RSA.importKey(private_key.encode("ISO-8859-1"))
-        h = SHA256.new(message)
-        signer = PKCS1_PSS.new(key)
-        return signer.sign(h).decode('ISO-8859-1')
+        return keys.sign(private_key, message).decode('ISO-8859-1')
 
     def verify_signature(self):
         # verifies the signature of the transaction
-        key = RSA.importKey(self.sender_address.encode('ISO-8859-1'))
-        h = SHA256.new(self.transaction_id.encode('ISO-8859-1'))
-        verifier = PKCS1_PSS.new(key)
-        try:
-            verifier.verify(h, self.signature.encode('ISO-8859-1'))
-            return True
-        except (ValueError, TypeError):
-            return False
+        return keys.verify(self.sender_address, self.transaction_id.encode('ISO-8859-1'), self.signature.encode('ISO-8859-1'))
 
     def calc_hash(self):
         # calculates hash of the transaction
@@ -40,25 +61,15 @@ class Transaction:
             "sender_address": self.sender_address,
             "receiver_address": self.receiver_address,
             "amount": self.amount,
-            "transaction_inputs": self.transaction_inputs
+            "transaction_inputs": [{'id': input.id, 'value': input.value} for input in self.transaction_inputs]
         }.__str__())
         return SHA256.new(transaction_string.encode("ISO-8859-2")).hexdigest()
 
     def compute_transaction_outputs(self):
-        # computes the two outputs of the transaction
+        # computes the two outputs of the transaction, the change of the sender and the amount of the receiver
         balance = 0
         for input in self.transaction_inputs:
-            balance += input['value']
-        output0 = {
-            'id': uuid.uuid4().int,
-            'transaction_id': self.transaction_id,
-            'recipient': self.sender_address,
-            'value': balance - self.amount
-        }
-        output1 = {
-            'id': uuid.uuid4().int,
-            'transaction_id': self.transaction_id,
-            'recipient': self.receiver_address,
-            'value': self.amount
-        }
+            balance += input.value
+        output0 = TxOutput(output_id(self.transaction_id, 0), self.transaction_id, fingerprint(self.sender_address), balance - self.amount)
+        output1 = TxOutput(output_id(self.transaction_id, 1), self.transaction_id, fingerprint(self.receiver_address), self.amount)
         return [output0, output1]
\ No newline at end of file
@@ -0,0 +1,139 @@
+from requests.adapters import HTTPAdapter, Retry
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock
+import concurrent.futures
+import requests
+import queue
+import time
+
+# keep-alive connections kept open to every peer
+POOL_SIZE = 4
+# seconds to connect to a peer and to wait for its response, so a hung peer cannot block its queue
+TIMEOUT = (3, 10)
+# statuses retried up to RETRIES times, with a wait of BACKOFF_FACTOR * 2 ** (retry - 1) seconds from the second retry on
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+RETRIES = 5
+BACKOFF_FACTOR = 0.5
+# a peer that does not connect or answer in time is retried fewer times than one that is overloaded
+CONNECT_RETRIES = 2
+READ_RETRIES = 1
+# longest wait between two retries of a request, whatever the backoff or Retry-After of the peer
+BACKOFF_MAX = 4
+# requests waiting in the send queue of a peer, newer ones are dropped while it is full
+QUEUE_SIZE = 1000
+
+class PeerStats:
+    def __init__(self):
+        # latency and retry statistics of the requests to a peer
+        self.lock = Lock()
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.dropped = 0
+        self.total_latency = 0
+        self.max_latency = 0
+
+    def record(self, latency, retries, failed):
+        with self.lock:
+            self.requests += 1
+            self.retries += retries
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if failed:
+                self.failures += 1
+
+    def drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def summary(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'retries': self.retries,
+                'dropped': self.dropped,
+                'average_latency': self.total_latency / self.requests if self.requests else 0,
+                'max_latency': self.max_latency
+            }
+
+class Peer:
+    def __init__(self, address):
+        # one keep-alive session and one ordered send queue per peer
+        self.address = address
+        self.session = requests.Session()
+        # every method is retried, POSTs to peers are safe to repeat since duplicate transactions and blocks are ignored
+        # a 503 of an overloaded peer is retried after its Retry-After header, no wait is longer than BACKOFF_MAX
+        retries = Retry(total=RETRIES, connect=CONNECT_RETRIES, read=READ_RETRIES, backoff_factor=BACKOFF_FACTOR,
+                        backoff_max=BACKOFF_MAX, status_forcelist=RETRY_STATUSES, allowed_methods=None)
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retries))
+        self.stats = PeerStats()
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.sender = None
+        self.lock = Lock()
+
+    def request(self, path, data=None, method='post'):
+        # sends a request over the pooled connection and records its latency and retries
+        start = time.time()
+        try:
+            response = self.session.request(method.upper(), self.address + path, data=data, timeout=TIMEOUT)
+        except requests.RequestException:
+            self.stats.record(time.time() - start, 0, True)
+            raise
+        retries = len(response.raw.retries.history) if response.raw is not None and response.raw.retries else 0
+        self.stats.record(time.time() - start, retries, response.status_code >= 500)
+        return response
+
+    def send(self, path, data):
+        # queues a request, the requests to a peer are sent one by one in order
+        # the request is dropped if the peer is so far behind that its queue is full
+        with self.lock:
+            if self.sender is None:
+                self.sender = Thread(target=self.send_loop, daemon=True)
+                self.sender.start()
+        try:
+            self.queue.put_nowait((path, data))
+        except queue.Full:
+            self.stats.drop()
+
+    def send_loop(self):
+        while True:
+            (path, data) = self.queue.get()
+            try:
+                self.request(path, data)
+            except requests.RequestException:
+                pass
+
+class PeerTransport:
+    def __init__(self, workers=None):
+        # peers by address and the executor shared by every broadcast, with a thread for every peer of the ring
+        self.peers = {}
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def peer(self, address):
+        # returns the peer with the given address, connecting to it on first use
+        with self.lock:
+            if address not in self.peers:
+                self.peers[address] = Peer(address)
+            return self.peers[address]
+
+    def request(self, address, path, data=None, method='post'):
+        return self.peer(address).request(path, data, method)
+
+    def send(self, addresses, path, data):
+        # queues a request to every address without waiting for the responses
+        for address in addresses:
+            self.peer(address).send(path, data)
+
+    def broadcast(self, addresses, path, data=None, method='post'):
+        # sends a request to every address in parallel and returns the responses of the peers that answered
+        futures = [self.executor.submit(self.request, address, path, data, method) for address in addresses]
+        concurrent.futures.wait(futures)
+        return [f.result() for f in futures if f.exception() is None]
+
+    def stats(self):
+        # returns the statistics of every peer by address
+        with self.lock:
+            peers = list(self.peers.values())
+        return {peer.address: peer.stats.summary() for peer in peers}
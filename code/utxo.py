@@ -0,0 +1,87 @@
+def largest_first(outputs, amount):
+    # spends the largest outputs first, so that few inputs cover the amount
+    selected = []
+    balance = 0
+    for output in sorted(outputs, key=lambda o: o.value, reverse=True):
+        if balance >= amount:
+            break
+        selected.append(output)
+        balance += output.value
+    return selected
+
+def smallest_sufficient(outputs, amount):
+    # spends the smallest single output that covers the amount, otherwise falls back to largest first
+    best = None
+    for output in outputs:
+        if output.value >= amount and (best is None or output.value < best.value):
+            best = output
+    if best is not None:
+        return [best]
+    return largest_first(outputs, amount)
+
+COIN_SELECTION = {
+    'largest_first': largest_first,
+    'smallest_sufficient': smallest_sufficient
+}
+
+class UTXOSet:
+    def __init__(self, outputs=()):
+        # unspent outputs indexed by output id, with a running balance for every owner (the fingerprint of its key)
+        self.outputs = {}
+        self.by_owner = {}
+        self.balances = {}
+        for output in outputs:
+            self.add(output)
+
+    def __getstate__(self):
+        # only the outputs are sent over the network, the indexes are rebuilt by the receiver
+        return list(self.outputs.values())
+
+    def __setstate__(self, outputs):
+        self.__init__(outputs)
+
+    def __iter__(self):
+        return iter(self.outputs.values())
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def __contains__(self, output_id):
+        return output_id in self.outputs
+
+    def add(self, output):
+        # adds an unspent output, outputs without value are not kept
+        if output.value == 0 or output.id in self.outputs:
+            return
+        owner = output.recipient
+        self.outputs[output.id] = output
+        self.by_owner.setdefault(owner, {})[output.id] = output
+        self.balances[owner] = self.balances.get(owner, 0) + output.value
+
+    def spend(self, output_id):
+        # removes an output from the set and returns it, or None if it is not unspent
+        output = self.outputs.pop(output_id, None)
+        if output is None:
+            return None
+        owner = output.recipient
+        del self.by_owner[owner][output_id]
+        self.balances[owner] -= output.value
+        return output
+
+    def get(self, output_id):
+        # returns the unspent output with the given id or None
+        return self.outputs.get(output_id)
+
+    def balance(self, owner):
+        # returns the sum of the unspent outputs of an owner
+        return self.balances.get(owner, 0)
+
+    def owned_by(self, owner):
+        # returns the unspent outputs of an owner
+        return list(self.by_owner.get(owner, {}).values())
+
+    def select(self, owner, amount, strategy='largest_first'):
+        # chooses outputs of an owner that cover the amount, or returns None if the balance is not enough
+        if self.balance(owner) < amount:
+            return None
+        return COIN_SELECTION[strategy](self.by_owner.get(owner, {}).values(), amount)
@@ -0,0 +1,77 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from threading import Lock
+import multiprocessing
+import os
+
+# number of verified transaction ids kept in memory
+VERIFIED_CACHE_SIZE = 100000
+# batches smaller than this are verified on the calling thread
+BATCH_THRESHOLD = 16
+
+def verify_transaction(transaction):
+    # checks that the id of a transaction is the hash of its contents and that it is signed by the sender (also in worker processes)
+    return transaction.transaction_id == transaction.calc_hash() and transaction.verify_signature()
+
+class Verifier:
+    def __init__(self, workers=None):
+        # verifier initialization, the pool is started on the first large batch
+        self.workers = workers or os.cpu_count() or 1
+        self.verified = OrderedDict()
+        self.lock = Lock()
+        self.pool = None
+        # concurrent batches must not each start a pool
+        self.pool_lock = Lock()
+
+    def is_verified(self, transaction):
+        # checks if the signature of the transaction has already been verified
+        with self.lock:
+            if transaction.transaction_id in self.verified:
+                self.verified.move_to_end(transaction.transaction_id)
+                return True
+            return False
+
+    def remember(self, transaction):
+        # caches the id of a transaction with a valid signature
+        with self.lock:
+            self.verified[transaction.transaction_id] = True
+            if len(self.verified) > VERIFIED_CACHE_SIZE:
+                self.verified.popitem(last=False)
+
+    def verify(self, transaction):
+        # verifies the signature of a single transaction
+        if self.is_verified(transaction):
+            return True
+        if verify_transaction(transaction):
+            self.remember(transaction)
+            return True
+        return False
+
+    def verify_batch(self, transactions):
+        # verifies many transactions, spreading large batches across the worker pool
+        results = [True] * len(transactions)
+        unverified = [i for i, t in enumerate(transactions) if not self.is_verified(t)]
+        if len(unverified) < BATCH_THRESHOLD or self.workers == 1:
+            verified = [verify_transaction(transactions[i]) for i in unverified]
+        else:
+            chunksize = max(1, len(unverified) // (4 * self.workers))
+            verified = list(self.get_pool().map(verify_transaction, [transactions[i] for i in unverified], chunksize=chunksize))
+        for i, valid in zip(unverified, verified):
+            results[i] = valid
+            if valid:
+                self.remember(transactions[i])
+        return results
+
+    def get_pool(self):
+        # returns the worker pool, starting it on first use
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+            return self.pool
+
+    def shutdown(self):
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
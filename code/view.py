@@ -0,0 +1,39 @@
+class ChainView:
+    __slots__ = ('blocks', 'height', 'tip')
+
+    def __init__(self, blocks):
+        # the chain as it was when the view was published, later blocks of the same list are ignored
+        self.blocks = blocks
+        self.height = len(blocks) - 1
+        self.tip = blocks[-1] if len(blocks) > 0 else None
+
+    def range(self, start, end=None):
+        # returns the blocks from start up to end (the tip by default)
+        end = self.height + 1 if end is None else min(end, self.height + 1)
+        # negative heights would slice from the tip
+        if start < 0 or start > end:
+            return []
+        try:
+            return self.blocks[start:end]
+        except IndexError:
+            # a stored chain that is being reorganized is shorter for a moment, the reader sees no blocks
+            return []
+
+    def find_common_ancestor(self, locator):
+        # returns the height of the first locator entry that is also on this chain
+        for (height, hash) in locator:
+            if height <= self.height and height < len(self.blocks) and self.blocks[height].current_hash == hash:
+                return height
+        return None
+
+class LedgerView:
+    __slots__ = ('balances', 'pending', 'version')
+
+    def __init__(self, ring, pending, version):
+        # the balance of every account and the number of pending transactions when the view was published
+        self.balances = {account.public_key: ring.balance(account.public_key) for account in ring}
+        self.pending = pending
+        self.version = version
+
+    def balance(self, public_key):
+        return self.balances.get(public_key, 0)
@@ -1,17 +1,34 @@
 from transaction import Transaction
-from Crypto.PublicKey import RSA
+from ring import fingerprint
+from utxo import UTXOSet
+import keys
 
 class Wallet:
-	def __init__(self):
-        # wallet initialization
-		key = RSA.generate(1024)
-		self.private_key = key.exportKey().decode('ISO-8859-1')
-		self.public_key = key.publickey().exportKey().decode('ISO-8859-1')
-		self.UTXOs = []
+	def __init__(self, key_file=None, key_type='rsa'):
+		# wallet initialization, the keys are loaded from key_file (or generated and saved there) on first use
+		self.key_file = key_file
+		self.key_type = key_type
+		self.keys = None
+		self.UTXOs = UTXOSet()
+
+	@property
+	def private_key(self):
+		return self.load_keys()[0]
+
+	@property
+	def public_key(self):
+		return self.load_keys()[1]
+
+	@property
+	def key_id(self):
+		# the fingerprint of the public key, which owns the outputs of the wallet
+		return fingerprint(self.public_key)
+
+	def load_keys(self):
+		if self.keys is None:
+			self.keys = keys.load_or_create(self.key_file, self.key_type)
+		return self.keys
 
 	def wallet_balance(self):
 		# computes wallet balance
-		balance = 0
-		for utxo in self.UTXOs:
-			balance += utxo['value']
-		return balance
\ No newline at end of file
+		return self.UTXOs.balance(self.key_id)
\ No newline at end of file
@@ -0,0 +1,301 @@
+from transaction import Transaction, TxInput, TxOutput, output_id
+from ring import Ring, Account, fingerprint
+from block import Block
+import struct
+
+# version of the wire format, every message starts with it and the message type
+VERSION = 3
+
+TRANSACTION = 1
+BLOCK = 2
+BLOCKS = 3
+RING_AND_CHAIN = 4
+RING_AND_TRANSACTIONS = 5
+TIP = 6
+LOCATOR = 7
+HEIGHT = 8
+TRANSACTIONS = 9
+
+HEADER = struct.Struct('<BB')
+COUNT = struct.Struct('<I')
+LENGTH = struct.Struct('<H')
+# transaction id, sender and receiver fingerprints, amount
+TRANSACTION_HEADER = struct.Struct('<32s8s8sq')
+# output id, value
+INPUT = struct.Struct('<16sq')
+# index, timestamp, nonce, previous hash, Merkle root, current hash
+BLOCK_HEADER = struct.Struct('<Idq32s32s32s')
+# id, port
+ACCOUNT = struct.Struct('<IH')
+# transaction id, index, recipient fingerprint, value (the output id is derived from the first two)
+OUTPUT = struct.Struct('<32sB8sq')
+# node id, height, tip hash
+CHAIN_TIP = struct.Struct('<Iq32s')
+# height, hash
+LOCATOR_ENTRY = struct.Struct('<q32s')
+BLOCK_HEIGHT = struct.Struct('<q')
+
+# fingerprint of the sender of the genesis transaction, which is not a key
+NO_KEY = bytes(8)
+
+class WireError(ValueError):
+    pass
+
+class Writer:
+    def __init__(self, message_type):
+        # every message is written into a single growing buffer
+        self.buffer = bytearray(HEADER.pack(VERSION, message_type))
+
+    def pack(self, fmt, *values):
+        self.buffer += fmt.pack(*values)
+
+    def blob(self, data):
+        # writes a length-prefixed byte string
+        self.buffer += LENGTH.pack(len(data))
+        self.buffer += data
+
+    def getvalue(self):
+        return bytes(self.buffer)
+
+class Reader:
+    def __init__(self, data, message_type):
+        # reads fields in place from a memoryview of the payload
+        self.view = memoryview(data)
+        self.offset = 0
+        (version, found_type) = self.unpack(HEADER)
+        if version != VERSION:
+            raise WireError(f'Unsupported wire format version {version}.')
+        if found_type != message_type:
+            raise WireError(f'Expected message type {message_type}, got {found_type}.')
+
+    def unpack(self, fmt):
+        if self.offset + fmt.size > len(self.view):
+            raise WireError('Truncated message.')
+        values = fmt.unpack_from(self.view, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def blob(self):
+        (length,) = self.unpack(LENGTH)
+        if self.offset + length > len(self.view):
+            raise WireError('Truncated message.')
+        data = self.view[self.offset:self.offset + length]
+        self.offset += length
+        return data
+
+    def done(self):
+        if self.offset != len(self.view):
+            raise WireError('Unexpected data after the end of the message.')
+
+def key_id(address):
+    # the fingerprint of a key as raw bytes
+    if address == '0':
+        return NO_KEY
+    return bytes.fromhex(fingerprint(address))
+
+def key_address(ring, key):
+    # the public key that a fingerprint refers to
+    if key == NO_KEY:
+        return '0'
+    account = ring.find_fingerprint(key.hex())
+    if account is None:
+        raise WireError('Unknown key fingerprint ' + key.hex() + '.')
+    return account.public_key
+
+def write_transaction(writer, transaction):
+    writer.pack(TRANSACTION_HEADER, bytes.fromhex(transaction.transaction_id), key_id(transaction.sender_address),
+                key_id(transaction.receiver_address), transaction.amount)
+    writer.pack(LENGTH, len(transaction.transaction_inputs))
+    for input in transaction.transaction_inputs:
+        writer.pack(INPUT, input.id.to_bytes(16, 'big'), input.value)
+    # the outputs are computed by the receiver from the inputs and the amount
+    writer.blob(transaction.signature.encode('ISO-8859-1'))
+
+def read_transaction(reader, ring):
+    (transaction_id, sender, receiver, amount) = reader.unpack(TRANSACTION_HEADER)
+    transaction = Transaction.__new__(Transaction)
+    transaction.transaction_id = transaction_id.hex()
+    transaction.sender_address = key_address(ring, sender)
+    transaction.receiver_address = key_address(ring, receiver)
+    transaction.amount = amount
+    (count,) = reader.unpack(LENGTH)
+    transaction.transaction_inputs = []
+    for _ in range(count):
+        (id, value) = reader.unpack(INPUT)
+        transaction.transaction_inputs.append(TxInput(int.from_bytes(id, 'big'), value))
+    transaction.transaction_outputs = transaction.compute_transaction_outputs()
+    transaction.signature = str(reader.blob(), 'ISO-8859-1')
+    return transaction
+
+def write_block(writer, block):
+    writer.pack(BLOCK_HEADER, block.index, block.timestamp, block.nonce, bytes.fromhex(block.previous_hash),
+                bytes.fromhex(block.merkle_root), bytes.fromhex(block.current_hash))
+    writer.pack(LENGTH, len(block.transactions))
+    for transaction in block.transactions:
+        write_transaction(writer, transaction)
+
+def read_block(reader, ring):
+    block = Block.__new__(Block)
+    (block.index, block.timestamp, block.nonce, previous_hash, merkle_root, current_hash) = reader.unpack(BLOCK_HEADER)
+    block.previous_hash = previous_hash.hex()
+    block.merkle_root = merkle_root.hex()
+    block.current_hash = current_hash.hex()
+    # received blocks are checked again before they are trusted
+    block.checked_hash = None
+    (count,) = reader.unpack(LENGTH)
+    block.transactions = [read_transaction(reader, ring) for _ in range(count)]
+    return block
+
+def write_blocks(writer, blocks):
+    writer.pack(COUNT, len(blocks))
+    for block in blocks:
+        write_block(writer, block)
+
+def read_blocks(reader, ring):
+    (count,) = reader.unpack(COUNT)
+    return [read_block(reader, ring) for _ in range(count)]
+
+def write_ring(writer, ring):
+    # accounts carry their full keys, every other message refers to them by fingerprint
+    writer.pack(LENGTH, len(ring))
+    for account in ring:
+        writer.pack(ACCOUNT, account.id, int(account.port))
+        writer.blob(account.ip.encode())
+        writer.blob(account.public_key.encode('ISO-8859-1'))
+    writer.pack(COUNT, len(ring.utxos))
+    for output in ring.utxos:
+        writer.pack(OUTPUT, bytes.fromhex(output.transaction_id), output.id & 0xff, bytes.fromhex(output.recipient), output.value)
+
+def read_ring(reader):
+    ring = Ring()
+    (count,) = reader.unpack(LENGTH)
+    for _ in range(count):
+        (id, port) = reader.unpack(ACCOUNT)
+        ip = str(reader.blob(), 'ascii')
+        ring.insert(Account(id, ip, str(port), str(reader.blob(), 'ISO-8859-1')))
+    (count,) = reader.unpack(COUNT)
+    for _ in range(count):
+        (transaction_id, index, recipient, value) = reader.unpack(OUTPUT)
+        account = ring.find_fingerprint(recipient.hex())
+        if account is None:
+            raise WireError('Unknown key fingerprint ' + recipient.hex() + '.')
+        transaction_id = transaction_id.hex()
+        ring.utxos.add(TxOutput(output_id(transaction_id, index), transaction_id, account.fingerprint, value))
+    return ring
+
+def encode_transaction(transaction):
+    writer = Writer(TRANSACTION)
+    write_transaction(writer, transaction)
+    return writer.getvalue()
+
+def decode_transaction(data, ring):
+    reader = Reader(data, TRANSACTION)
+    transaction = read_transaction(reader, ring)
+    reader.done()
+    return transaction
+
+def encode_transactions(transactions):
+    writer = Writer(TRANSACTIONS)
+    writer.pack(COUNT, len(transactions))
+    for transaction in transactions:
+        write_transaction(writer, transaction)
+    return writer.getvalue()
+
+def decode_transactions(data, ring):
+    reader = Reader(data, TRANSACTIONS)
+    (count,) = reader.unpack(COUNT)
+    transactions = [read_transaction(reader, ring) for _ in range(count)]
+    reader.done()
+    return transactions
+
+def encode_block(block):
+    writer = Writer(BLOCK)
+    write_block(writer, block)
+    return writer.getvalue()
+
+def decode_block(data, ring):
+    reader = Reader(data, BLOCK)
+    block = read_block(reader, ring)
+    reader.done()
+    return block
+
+def encode_blocks(blocks):
+    writer = Writer(BLOCKS)
+    write_blocks(writer, blocks)
+    return writer.getvalue()
+
+def decode_blocks(data, ring):
+    reader = Reader(data, BLOCKS)
+    blocks = read_blocks(reader, ring)
+    reader.done()
+    return blocks
+
+def encode_ring_and_chain(ring, blocks):
+    writer = Writer(RING_AND_CHAIN)
+    write_ring(writer, ring)
+    write_blocks(writer, blocks)
+    return writer.getvalue()
+
+def decode_ring_and_chain(data):
+    # the blocks are decoded with the keys of the ring that precedes them
+    reader = Reader(data, RING_AND_CHAIN)
+    ring = read_ring(reader)
+    blocks = read_blocks(reader, ring)
+    reader.done()
+    return (ring, blocks)
+
+def encode_ring_and_transactions(ring, transactions):
+    writer = Writer(RING_AND_TRANSACTIONS)
+    write_ring(writer, ring)
+    writer.pack(COUNT, len(transactions))
+    for transaction in transactions:
+        write_transaction(writer, transaction)
+    return writer.getvalue()
+
+def decode_ring_and_transactions(data):
+    reader = Reader(data, RING_AND_TRANSACTIONS)
+    ring = read_ring(reader)
+    (count,) = reader.unpack(COUNT)
+    transactions = [read_transaction(reader, ring) for _ in range(count)]
+    reader.done()
+    return (ring, transactions)
+
+def encode_tip(node_id, height, tip_hash):
+    writer = Writer(TIP)
+    writer.pack(CHAIN_TIP, node_id, height, bytes.fromhex(tip_hash))
+    return writer.getvalue()
+
+def decode_tip(data):
+    reader = Reader(data, TIP)
+    (node_id, height, tip_hash) = reader.unpack(CHAIN_TIP)
+    reader.done()
+    return (node_id, height, tip_hash.hex())
+
+def encode_locator(locator):
+    writer = Writer(LOCATOR)
+    writer.pack(LENGTH, len(locator))
+    for (height, hash) in locator:
+        writer.pack(LOCATOR_ENTRY, height, bytes.fromhex(hash))
+    return writer.getvalue()
+
+def decode_locator(data):
+    reader = Reader(data, LOCATOR)
+    (count,) = reader.unpack(LENGTH)
+    locator = []
+    for _ in range(count):
+        (height, hash) = reader.unpack(LOCATOR_ENTRY)
+        locator.append((height, hash.hex()))
+    reader.done()
+    return locator
+
+def encode_height(height):
+    # a missing height is sent as -1
+    writer = Writer(HEIGHT)
+    writer.pack(BLOCK_HEIGHT, -1 if height is None else height)
+    return writer.getvalue()
+
+def decode_height(data):
+    reader = Reader(data, HEIGHT)
+    (height,) = reader.unpack(BLOCK_HEIGHT)
+    reader.done()
+    return None if height < 0 else height